@@ -0,0 +1,113 @@
+"""
+Micro-benchmarks for hot code paths, and the startup time. Run from the src
+directory, e.g.
+    python -m Testing.benchmarks nbrs
+"""
+
+import os
+import sys
+import time as tm
+import timeit
+import tempfile
+import subprocess
+from os.path import join, exists
+
+from utils import (diff_values, get_nbrs, get_nbr_table, src_direc,
+                   base_direc)
+
+
+def alloc_nbrs(x, y, x_size, y_size):
+    """The original implementation of get_nbrs, allocating a new list on every
+    call, for comparison."""
+    nbrs = []
+    for i in range(max(0,x-1), min(x_size,x+2)):
+        for j in range(max(0,y-1), min(y_size,y+2)):
+            nbrs.append((i, j))
+    return nbrs
+
+def bench_nbrs(repeat=5, number=20):
+    """Time looking up the neighbours of every cell on boards of each of the
+    standard difficulties, printing the time per call."""
+    print("{:>6} {:>12} {:>12} {:>12}".format(
+        'diff', 'alloc (ns)', 'nbrs (ns)', 'table (ns)'))
+    for diff in ['b', 'i', 'e', 'm']:
+        x_size, y_size = diff_values[diff][:2]
+        coords = [(x, y) for x in range(x_size) for y in range(y_size)]
+        def alloc():
+            for (x, y) in coords:
+                alloc_nbrs(x, y, x_size, y_size)
+        def nbrs():
+            for (x, y) in coords:
+                get_nbrs(x, y, x_size, y_size)
+        def table():
+            nbr_table = get_nbr_table(x_size, y_size)
+            for (x, y) in coords:
+                nbr_table[y*x_size + x]
+        times = []
+        for func in [alloc, nbrs, table]:
+            best = min(timeit.repeat(func, repeat=repeat, number=number))
+            times.append(1e9 * best / (number * len(coords)))
+        print("{:>6} {:>12.1f} {:>12.1f} {:>12.1f}".format(diff, *times))
+
+def get_startup_targets():
+    """Get the commands used to launch each version of the game (exiting once
+    the UI has been created), with None for frozen builds which don't exist.
+    The frozen builds are made with PyInstaller from the spec files, e.g.
+        pyinstaller MineGauler.spec"""
+    ext = '.exe' if sys.platform.startswith('win') else ''
+    dist_direc = join(base_direc, 'dist', 'MineGauler')
+    targets = {
+        'gui': [sys.executable, join(src_direc, 'main.py')],
+        'cli': [sys.executable, join(src_direc, 'cli_entry.py')],
+        'gui (frozen)': [join(dist_direc, 'MineGauler' + ext)],
+        'cli (frozen)': [join(dist_direc, 'MineGaulerCLI' + ext)],
+        }
+    for name, cmd in targets.items():
+        targets[name] = cmd + ['--startup-only'] if exists(cmd[0]) else None
+    return targets
+
+def time_launch(cmd, env):
+    """Run the command, returning the time taken in seconds or None if it
+    failed."""
+    start = tm.perf_counter()
+    result = subprocess.run(cmd, env=env, stdin=subprocess.DEVNULL,
+                            stdout=subprocess.DEVNULL,
+                            stderr=subprocess.DEVNULL)
+    if result.returncode != 0:
+        return None
+    return tm.perf_counter() - start
+
+def bench_startup(repeat=5):
+    """Time launching the GUI and CLI from source and from the frozen builds.
+    The cold time is for the first launch (from source this is with an empty
+    bytecode cache), and the warm time is the best of the launches after."""
+    print("{:>14} {:>12} {:>12}".format('target', 'cold (ms)', 'warm (ms)'))
+    for name, cmd in get_startup_targets().items():
+        if cmd is None:
+            print("{:>14} {:>25}".format(name, 'not built'))
+            continue
+        with tempfile.TemporaryDirectory() as cache_direc:
+            env = dict(os.environ, PYTHONPYCACHEPREFIX=cache_direc)
+            # Bytecode must be written by the first launch for the warm ones.
+            env.pop('PYTHONDONTWRITEBYTECODE', None)
+            cold = time_launch(cmd, env)
+            warm = [time_launch(cmd, env) for i in range(repeat)]
+        if cold is None or None in warm:
+            print("{:>14} {:>25}".format(name, 'failed'))
+            continue
+        print("{:>14} {:>12.0f} {:>12.0f}".format(name, 1e3 * cold,
+                                                  1e3 * min(warm)))
+
+
+benchmarks = {
+    'nbrs': bench_nbrs,
+    'startup': bench_startup,
+}
+
+
+
+if __name__ == '__main__':
+    names = sys.argv[1:] or list(benchmarks)
+    for name in names:
+        print(f"Benchmark '{name}':")
+        benchmarks[name]()
@@ -1,5 +1,6 @@
 
 from utils import diff_values
+from board import Board
 
 
 class DummyProcessor:
@@ -8,6 +9,7 @@ class DummyProcessor:
         self.nr_mines = self.nr_flags = 0
         self.diff = None
         self.first_success = False
+        self.bbbv_percentile = None
         for attr in settings:
             setattr(self, attr, settings[attr])
         self.game = DummyGame(self)
@@ -31,6 +33,8 @@ class DummyProcessor:
         pass
     def calculate_probs(self):
         pass
+    def auto_solve(self, guess=False):
+        pass
     def save_settings(self):
         pass
     def close_game(self):
@@ -38,6 +42,6 @@ class DummyProcessor:
 
 class DummyGame:
     def __init__(self, processor):
-        self.board = processor.y_size*[processor.x_size*[0]]
+        self.board = Board(processor.x_size, processor.y_size)
         self.mf = processor.y_size*[processor.x_size*[0]]
         self.state = None
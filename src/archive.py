@@ -0,0 +1,224 @@
+"""
+Compact binary storage of many minefields in a single file.
+
+The file starts with an 8-byte header (the magic bytes b'MGMF' followed by the
+format version), and then contains one record per minefield. Each record
+consists of a 16-byte little-endian header:
+    x_size (uint16), y_size (uint16), per_cell (uint8), bits per cell (uint8),
+    reserved (uint16), nr_mines (uint32), 3bv (uint32)
+followed by the number of mines in each cell, in row-major order, packed with
+the given number of bits per cell (one bit when per_cell is 1), padded to a
+whole number of bytes.
+
+Records are only ever appended, so boards can be added to an existing archive
+as they are played or generated. Archives are read through a memory map, and
+when all boards have the same settings they can be viewed as one numpy record
+array without copying.
+"""
+
+import os
+import mmap
+import struct
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from minefield import Minefield, MinefieldBatch
+
+
+MAGIC = b'MGMF'
+VERSION = 1
+file_header = struct.Struct('<4sB3x')
+record_header = struct.Struct('<HHBBxxII')
+
+def get_bits_per_cell(per_cell):
+    """Number of bits used to store the number of mines in a cell."""
+    for bits in [1, 2, 4]:
+        if per_cell < 2**bits:
+            return bits
+    return 8
+
+def get_data_size(x_size, y_size, bits):
+    """Number of bytes used to store the packed mines of a board."""
+    return (x_size*y_size*bits + 7) // 8
+
+def pack_mines(mines, bits):
+    """Pack a grid of mine counts (list of rows), returning bytes."""
+    per_byte = 8 // bits
+    cells = [n for row in mines for n in row]
+    cells += (-len(cells) % per_byte) * [0]
+    data = bytearray(len(cells) // per_byte)
+    for i in range(len(data)):
+        byte = 0
+        for k, n in enumerate(cells[i*per_byte:(i+1)*per_byte]):
+            byte |= n << (k*bits)
+        data[i] = byte
+    return bytes(data)
+
+def unpack_mines(data, x_size, y_size, bits):
+    """Unpack bytes created by pack_mines, returning a grid of mine counts."""
+    per_byte = 8 // bits
+    mask = 2**bits - 1
+    cells = [(byte >> (k*bits)) & mask for byte in data
+             for k in range(per_byte)]
+    return [cells[j*x_size:(j+1)*x_size] for j in range(y_size)]
+
+def pack_mines_array(mines, bits):
+    """Pack a stack of mine count arrays, returning a uint8 array with the
+    packed data of each board as a row."""
+    flat = mines.reshape(len(mines), -1).astype(np.uint8)
+    if bits < 8:
+        # Expand each count into its bits (least significant first) and pack.
+        shifts = np.arange(bits, dtype=np.uint8)
+        flat = ((flat[:, :, None] >> shifts) & 1).reshape(len(mines), -1)
+        flat = np.packbits(flat, axis=1, bitorder='little')
+    return flat
+
+def unpack_mines_array(data, x_size, y_size, bits):
+    """Unpack a uint8 array of packed boards (one per row), returning a stack
+    of mine count arrays."""
+    if bits < 8:
+        flat = np.unpackbits(data, axis=1, count=x_size*y_size*bits,
+                             bitorder='little')
+        flat = flat.reshape(len(data), x_size*y_size, bits)
+        flat = (flat << np.arange(bits, dtype=np.uint8)).sum(axis=2)
+    else:
+        flat = data
+    return flat.astype(np.int8).reshape(len(data), y_size, x_size)
+
+def open_for_append(path):
+    """Open the archive at path for appending, writing the file header if the
+    file doesn't already exist."""
+    exists = os.path.exists(path) and os.path.getsize(path) > 0
+    f = open(path, 'ab')
+    if not exists:
+        f.write(file_header.pack(MAGIC, VERSION))
+    return f
+
+def write_minefields(path, minefields):
+    """Append minefields (created Minefield objects) to the archive at path."""
+    with open_for_append(path) as f:
+        for mf in minefields:
+            bits = get_bits_per_cell(mf.per_cell)
+            f.write(record_header.pack(mf.x_size, mf.y_size, mf.per_cell, bits,
+                                       mf.nr_mines, mf.get_3bv()))
+            f.write(pack_mines(mf, bits))
+
+def write_batch(path, batch):
+    """Append all the minefields in a created MinefieldBatch to the archive at
+    path, packing them together."""
+    bits = get_bits_per_cell(batch.per_cell)
+    data = pack_mines_array(batch.mines, bits)
+    records = np.zeros(len(batch), get_record_dtype(batch.x_size, batch.y_size,
+                                                    bits))
+    records['x_size'] = batch.x_size
+    records['y_size'] = batch.y_size
+    records['per_cell'] = batch.per_cell
+    records['bits'] = bits
+    records['nr_mines'] = batch.nr_mines
+    records['3bv'] = batch.bbbv
+    records['data'] = data
+    with open_for_append(path) as f:
+        f.write(records.tobytes())
+
+def get_record_dtype(x_size, y_size, bits):
+    """Get the numpy dtype of a record for boards of the given size."""
+    return np.dtype([('x_size', '<u2'), ('y_size', '<u2'), ('per_cell', 'u1'),
+                     ('bits', 'u1'), ('reserved', '<u2'),
+                     ('nr_mines', '<u4'), ('3bv', '<u4'),
+                     ('data', 'u1', (get_data_size(x_size, y_size, bits),))])
+
+
+class MinefieldArchive:
+    """Read access to an archive of minefields through a memory map."""
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        self.mmap = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version = file_header.unpack_from(self.mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f"Not a minefield archive: {path}")
+        if version != VERSION:
+            raise ValueError(f"Unsupported archive version {version}: {path}")
+        # Store the offset of every record to allow random access.
+        self.offsets = []
+        offset = file_header.size
+        while offset < len(self.mmap):
+            self.offsets.append(offset)
+            x_size, y_size, _, bits, _, _ = record_header.unpack_from(
+                self.mmap, offset)
+            offset += record_header.size + get_data_size(x_size, y_size, bits)
+    def __repr__(self):
+        return "<archive of {} minefields at {}>".format(len(self), self.path)
+    def __len__(self):
+        return len(self.offsets)
+    def __getitem__(self, index):
+        """Get the minefield at the given index as a Minefield object."""
+        header = self.get_header(index)
+        x_size, y_size, per_cell, bits, nr_mines, bbbv = header
+        mines = unpack_mines(self.get_data(index), x_size, y_size, bits)
+        mf = Minefield(x_size, y_size)
+        mf.create_from_list([(x, y) for y, row in enumerate(mines)
+                             for x, n in enumerate(row) for k in range(n)])
+        mf.per_cell = per_cell
+        mf.get_completed_board()
+        mf.get_3bv()
+        return mf
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+    def __enter__(self):
+        return self
+    def __exit__(self, *args):
+        self.close()
+    def close(self):
+        self.mmap.close()
+        self.file.close()
+    def get_header(self, index):
+        """Get the tuple (x_size, y_size, per_cell, bits, nr_mines, 3bv) for
+        the minefield at the given index."""
+        return record_header.unpack_from(self.mmap, self.offsets[index])
+    def get_data(self, index):
+        """Get a memoryview of the packed mines of the minefield at the given
+        index (without copying)."""
+        x_size, y_size, _, bits, _, _ = self.get_header(index)
+        start = self.offsets[index] + record_header.size
+        size = get_data_size(x_size, y_size, bits)
+        return memoryview(self.mmap)[start:start+size]
+    def get_records(self):
+        """Get a numpy record array viewing every record in the archive without
+        copying, with fields named as in the record header plus 'data'. All
+        the minefields must have the same size and number of bits per cell.
+        The array must be deleted before the archive is closed."""
+        if len(self) == 0:
+            return None
+        x_size, y_size, _, bits, _, _ = self.get_header(0)
+        dtype = get_record_dtype(x_size, y_size, bits)
+        if len(self.mmap) - file_header.size != len(self) * dtype.itemsize:
+            raise ValueError("Archive contains minefields of different sizes.")
+        return np.frombuffer(self.mmap, dtype, offset=file_header.size)
+    def get_batch(self):
+        """Get all the minefields as a MinefieldBatch. All the minefields must
+        have the same settings. The 3bv values are taken from the archive, so
+        call the batch's get_3bv method if the opening labels are needed. An
+        empty archive gives an empty batch of boards with no cells."""
+        records = self.get_records()
+        if records is None:
+            batch = MinefieldBatch(0, 0, 0)
+            batch.get_completed_boards()
+            batch.bbbv = np.zeros(0, dtype=int)
+            return batch
+        x_size, y_size = int(records['x_size'][0]), int(records['y_size'][0])
+        nr_mines, per_cell = records['nr_mines'][0], records['per_cell'][0]
+        if ((records['nr_mines'] != nr_mines).any()
+            or (records['per_cell'] != per_cell).any()):
+            raise ValueError("Archive contains minefields of different settings.")
+        batch = MinefieldBatch(len(records), x_size, y_size)
+        batch.nr_mines, batch.per_cell = int(nr_mines), int(per_cell)
+        batch.mines = unpack_mines_array(records['data'], x_size, y_size,
+                                         int(records['bits'][0]))
+        batch.get_completed_boards()
+        batch.bbbv = records['3bv'].astype(int)
+        return batch
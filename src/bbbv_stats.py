@@ -0,0 +1,153 @@
+"""
+Estimates of the distribution of 3bv for any board settings, used to judge
+whether a board was easy or hard for its settings.
+
+The distributions are estimated by Monte Carlo sampling of boards, spread
+across processes, and stored as tables of percentiles. The tables are cached
+in memory and in a JSON file in the files directory, so only the first lookup
+for a given group of settings pays for the sampling. The file comes with the
+tables for the standard difficulties (filled in by running this module).
+"""
+
+import json
+import random as rnd
+from bisect import bisect_left, bisect_right
+from os.path import join
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from utils import file_direc, get_nbrs, load_json_cache
+from minefield import Minefield, MinefieldBatch
+
+
+cache_path = join(file_direc, '3bv_percentiles.json')
+# Percentile tables by settings string, filled in from the cache file.
+percentile_tables = {}
+cache_loaded = False
+# Number of different first clicks to sample boards for when first_success is
+#  True (the 3bv distribution depends on where the safe area is).
+nr_first_clicks = 32
+# Largest number of boards created in one batch, to limit the memory used.
+max_batch_size = 1024
+
+def settings_to_str(x_size, y_size, nr_mines, per_cell, first_success):
+    return f'{x_size}x{y_size},{nr_mines},{per_cell},{first_success}'
+
+def load_cache():
+    global cache_loaded
+    percentile_tables.update(load_json_cache(cache_path) or {})
+    cache_loaded = True
+
+def save_cache():
+    with open(cache_path, 'w') as f:
+        json.dump(percentile_tables, f)
+
+def calc_percentiles(values):
+    """Return the 0th to 100th percentiles of the values, interpolating
+    linearly between ranks."""
+    values = sorted(values)
+    percentiles = []
+    for p in range(101):
+        pos = p * (len(values) - 1) / 100
+        i = int(pos)
+        if i + 1 < len(values):
+            percentiles.append(values[i] + (pos - i)*(values[i+1] - values[i]))
+        else:
+            percentiles.append(values[i])
+    return percentiles
+
+def sample_3bv(x_size, y_size, nr_mines, per_cell=1, first_success=True,
+               nr_samples=100000, seed=0, workers=1):
+    """Return a list of the 3bv of nr_samples randomly created boards."""
+    rng = rnd.Random(seed)
+    if first_success:
+        # Split the samples between first clicks chosen at random.
+        groups = []
+        for i in range(nr_first_clicks):
+            x, y = rng.randrange(x_size), rng.randrange(y_size)
+            nr = nr_samples // nr_first_clicks
+            if i < nr_samples % nr_first_clicks:
+                nr += 1
+            groups.append((nr, get_nbrs(x, y, x_size, y_size)))
+    else:
+        groups = [(nr_samples, [])]
+    args = [(seed + i, nr, x_size, y_size, nr_mines, per_cell, safe_coords)
+            for i, (nr, safe_coords) in enumerate(groups) if nr > 0]
+    if workers > 1 and len(args) > 1:
+        with ProcessPoolExecutor(workers) as executor:
+            results = list(executor.map(sample_group, *zip(*args)))
+    else:
+        results = [sample_group(*a) for a in args]
+    return [bbbv for r in results for bbbv in r]
+
+def sample_group(seed, nr_samples, x_size, y_size, nr_mines, per_cell,
+                 safe_coords):
+    """Return a list of the 3bv of nr_samples boards created with the given
+    safe coordinates."""
+    if np is not None:
+        # Create exactly the boards needed, a limited number at a time.
+        rng = np.random.default_rng(seed)
+        bbbvs = []
+        for start in range(0, nr_samples, max_batch_size):
+            nr = min(max_batch_size, nr_samples - start)
+            batch = MinefieldBatch(nr, x_size, y_size)
+            batch.create(nr_mines, per_cell, safe_coords, rng)
+            bbbvs += batch.bbbv.tolist()
+        return bbbvs
+    rng = rnd.Random(seed)
+    bbbvs = []
+    for i in range(nr_samples):
+        mf = Minefield(x_size, y_size)
+        mf.create(nr_mines, per_cell, safe_coords, rng)
+        bbbvs.append(mf.bbbv)
+    return bbbvs
+
+def get_3bv_percentiles(x_size, y_size, nr_mines, per_cell=1,
+                        first_success=True, sample=True, nr_samples=100000,
+                        workers=1):
+    """Return the table of 3bv percentiles (0 to 100) for the given settings.
+    If it isn't cached, sample boards to create it if sample is True, and
+    otherwise return None."""
+    if not cache_loaded:
+        load_cache()
+    key = settings_to_str(x_size, y_size, nr_mines, per_cell, first_success)
+    if key in percentile_tables:
+        return percentile_tables[key]['percentiles']
+    if not sample:
+        return None
+    bbbvs = sample_3bv(x_size, y_size, nr_mines, per_cell, first_success,
+                       nr_samples, workers=workers)
+    percentile_tables[key] = {'samples': nr_samples,
+                              'percentiles': calc_percentiles(bbbvs)}
+    save_cache()
+    return percentile_tables[key]['percentiles']
+
+def get_3bv_percentile(bbbv, x_size, y_size, nr_mines, per_cell=1,
+                       first_success=True, sample=True, **kwargs):
+    """Return the percentile (0 to 100) of the given 3bv among boards with the
+    given settings, i.e. the percentage of boards with lower 3bv. Return None
+    if the percentiles aren't cached and sample is False."""
+    table = get_3bv_percentiles(x_size, y_size, nr_mines, per_cell,
+                                first_success, sample, **kwargs)
+    if table is None:
+        return None
+    # Take the middle of any run of equal percentile values.
+    lo, hi = bisect_left(table, bbbv), bisect_right(table, bbbv)
+    return min(100, (lo + hi) / 2)
+
+
+
+if __name__ == '__main__':
+    # Fill in the cache for the standard difficulties.
+    import os
+    from utils import diff_values
+    for diff in ['b', 'i', 'e', 'm']:
+        for per_cell in [1, 2, 3]:
+            for first_success in [True, False]:
+                print(diff, per_cell, first_success)
+                get_3bv_percentiles(*diff_values[diff], per_cell,
+                                    first_success, workers=os.cpu_count())
@@ -0,0 +1,122 @@
+"""
+Compact representation of the game board, as seen by the player.
+
+Each cell is stored as one byte of a flat bytearray, in row-major order (the
+cell at (x, y) is at index y*x_size + x). The top three bits hold the state of
+the cell and the bottom five bits hold its count - the number displayed for a
+revealed cell, or the number of flags or mines otherwise. An unclicked cell is
+stored as 0, so a new board is just a zeroed bytearray.
+
+Read-only views share the data of a board without copying it, so that the UI,
+solver and highscores can all look at the current game board. The string
+representation used previously (e.g. 'U', 'F1', '!2' or an int - see main.py)
+is still available through to_legacy and from_legacy, for printing and for
+compatibility.
+"""
+
+from utils import prettify_grid
+
+
+UNCLICKED, NUMBER, FLAG, MINE, HIT, LIFE, CROSS = range(7)
+COUNT_BITS = 5
+COUNT_MASK = 2**COUNT_BITS - 1
+
+# Characters used for the states in the string representation.
+state_chars = {
+    UNCLICKED: 'U',
+    FLAG:      'F',
+    MINE:      'M',
+    HIT:       '!',
+    LIFE:      'L',
+    CROSS:     'X',
+    }
+char_states = {c: s for s, c in state_chars.items()}
+
+def encode(state, count=0):
+    assert 0 <= count <= COUNT_MASK, "Count {} out of range.".format(count)
+    return state << COUNT_BITS | count
+
+def code_to_legacy(code):
+    """Convert an encoded cell to its string representation (or int)."""
+    state, count = code >> COUNT_BITS, code & COUNT_MASK
+    if state == NUMBER:
+        return count
+    elif state == UNCLICKED:
+        return 'U'
+    return state_chars[state] + str(count)
+
+def legacy_to_code(cell):
+    """Convert a cell in the string representation (or int) to its code."""
+    if type(cell) is int:
+        return encode(NUMBER, cell)
+    elif cell == 'U':
+        return encode(UNCLICKED)
+    return encode(char_states[cell[0]], int(cell[1:]))
+
+
+class BoardView:
+    """Read-only access to the cells of a board, which may be shared."""
+    def __init__(self, x_size, y_size, data):
+        self.x_size, self.y_size = x_size, y_size
+        self.data = data
+    def __repr__(self):
+        return "<{}x{} board>".format(self.x_size, self.y_size)
+    def __str__(self):
+        return prettify_grid(self.to_legacy(), {0:'-', 'U':'#'})
+    def __eq__(self, other):
+        return (isinstance(other, BoardView)
+                and (self.x_size, self.y_size) == (other.x_size, other.y_size)
+                and self.data == other.data)
+    def get_code(self, x, y):
+        return self.data[y*self.x_size + x]
+    def get_state(self, x, y):
+        return self.data[y*self.x_size + x] >> COUNT_BITS
+    def get_count(self, x, y):
+        return self.data[y*self.x_size + x] & COUNT_MASK
+    def get(self, x, y):
+        """Get the tuple (state, count) for the cell at (x, y)."""
+        code = self.data[y*self.x_size + x]
+        return code >> COUNT_BITS, code & COUNT_MASK
+    def get_coords(self, *states):
+        """Get the coordinates of all cells in any of the given states, in the
+        same order as Minefield.all_coords."""
+        X = self.x_size
+        codes = self.data
+        return [(x, y) for x in range(X) for y in range(self.y_size)
+                if codes[y*X + x] >> COUNT_BITS in states]
+    def count_total(self, *states):
+        """Get the sum of the counts of all cells in any of the given states,
+        e.g. the number of flags placed."""
+        return sum(c & COUNT_MASK for c in self.data
+                   if c >> COUNT_BITS in states)
+    def copy(self):
+        """Get a new, writable board with the same contents."""
+        return Board(self.x_size, self.y_size, bytearray(self.data))
+    def to_legacy(self):
+        """Get the board in the string representation, as a list of rows."""
+        X = self.x_size
+        cells = [code_to_legacy(c) for c in self.data]
+        return [cells[j*X:(j+1)*X] for j in range(self.y_size)]
+
+
+class Board(BoardView):
+    """A writable board, initially with all cells unclicked."""
+    def __init__(self, x_size, y_size, data=None):
+        if data is None:
+            data = bytearray(x_size*y_size)
+        super().__init__(x_size, y_size, data)
+    @classmethod
+    def from_legacy(cls, grid):
+        """Create a board from one in the string representation."""
+        data = bytearray(legacy_to_code(c) for row in grid for c in row)
+        return cls(len(grid[0]), len(grid), data)
+    def view(self):
+        """Get a read-only view of the board, which reflects any later changes
+        without copying."""
+        return BoardView(self.x_size, self.y_size,
+                         memoryview(self.data).toreadonly())
+    def set(self, x, y, state, count=0):
+        self.data[y*self.x_size + x] = encode(state, count)
+    def reset(self):
+        """Set every cell back to unclicked."""
+        self.data[:] = bytes(len(self.data))
@@ -69,12 +69,8 @@ class GameCLI:
     def start_game(self):
         """Not needed for CLI, this is called when the first click is made."""
         pass
-    def reveal_cell(self, x, y):
-        """Not needed for a CLI, cells are revealed as they are chosen."""
-        pass
-    def flag(self, x, y):
-        pass
-    def unflag(self, x, y):
+    def update_cells(self, cells):
+        """Not needed for a CLI, the board is printed before each click."""
         pass
     def finalise_loss(self):
         print("\nYou hit a mine!")
@@ -83,6 +79,11 @@ class GameCLI:
     def finalise_win(self):
         print("\nYou won!")
         self.procr.game.print_board()
+        self.bbbv_percentile_ready()
+    def bbbv_percentile_ready(self):
+        if self.procr.bbbv_percentile is not None:
+            print("3bv {}, harder than {:.0f}% of boards".format(
+                self.procr.game.mf.get_3bv(), self.procr.bbbv_percentile))
     def highscore_added(self, h):
         pass
 
@@ -0,0 +1,362 @@
+"""
+Headless game engine, containing the rules of the game without any user
+interface, so games can be driven directly from code (e.g. by bots, tests or
+servers) as well as through the GUI and CLI.
+
+The engine sends events to any callbacks registered with add_callback:
+    'new_game' - a new game has been prepared, with no arguments
+    'start'    - the first click was made and the minefield was created
+    'update'   - sent once per action (click, flag or chord) that changed the
+                 board, with the list of coordinates of the changed cells
+    'lose'     - the game was lost, sent after the final update
+    'win'      - the game was won, sent after the final update
+"""
+
+import time as tm
+import random as rnd
+
+from minefield import Minefield
+from huge_minefield import HugeMinefield
+from board import (Board, UNCLICKED, NUMBER, FLAG, MINE, HIT, LIFE, CROSS,
+                   COUNT_BITS, COUNT_MASK)
+from utils import (get_nbr_index_table, prettify_grid, diff_values,
+                   default_settings)
+
+
+class Engine:
+    # Settings which affect the game. The drag_select setting doesn't change
+    #  the rules, but it is recorded with the game for the highscores.
+    settings_keys = ['x_size', 'y_size', 'nr_mines', 'per_cell',
+                     'first_success', 'drag_select']
+    events = ['new_game', 'start', 'update', 'lose', 'win']
+    # Boards with at least this many cells use a HugeMinefield, with at most
+    #  this many bytes of its completed board kept in memory.
+    huge_board_size = 10**6
+    huge_memory_budget = 2**26
+    def __init__(self, rng=None, **settings):
+        """Settings not given take their default values. The argument rng can
+        be a random.Random instance or a seed to create one with, which is
+        used to create the minefields, otherwise the global random state is
+        used."""
+        for attr in self.settings_keys:
+            setattr(self, attr, settings.get(attr, default_settings[attr]))
+        if rng is not None and not isinstance(rng, rnd.Random):
+            rng = rnd.Random(rng)
+        self.rng = rng
+        self.set_diff()
+        self.callbacks = {event: [] for event in self.events}
+        self.new_game()
+    def add_callback(self, event, func):
+        self.callbacks[event].append(func)
+    def remove_callback(self, event, func):
+        self.callbacks[event].remove(func)
+    def emit(self, event, *args):
+        for func in self.callbacks[event]:
+            func(*args)
+    def set_diff(self):
+        """Set the difficulty character corresponding to the current size and
+        number of mines."""
+        for d in diff_values:
+            if diff_values[d] == (self.x_size, self.y_size, self.nr_mines):
+                self.diff = d
+                break
+        else:
+            self.diff = 'c'
+    def change_difficulty(self, diff, x_size=None, y_size=None, nr_mines=None):
+        """Change difficulty, creating a new game with new settings. Arguments
+        x_size, y_size, nr_mines are ignored unless diff=='c'."""
+        if diff == 'c':
+            self.x_size, self.y_size = x_size, y_size
+            self.nr_mines = nr_mines
+        elif diff in diff_values:
+            self.x_size, self.y_size, self.nr_mines = diff_values[diff]
+        else:
+            raise ValueError('Invalid difficulty character, {}.'.format(diff))
+        self.set_diff()
+        self.new_game()
+    def change_setting(self, setting, value):
+        """Change one of the settings in settings_keys. Changes to the size or
+        number of mines take effect from the next game, others from the next
+        time a game is started."""
+        if setting not in self.settings_keys:
+            raise ValueError('Invalid setting, {}.'.format(setting))
+        setattr(self, setting, value)
+        if setting in ['x_size', 'y_size', 'nr_mines']:
+            self.set_diff()
+    def new_game(self):
+        self.nr_flags = 0
+        self.changed_cells = []
+        self.end_event = None
+        self.game = Game(self)
+        self.emit('new_game')
+    def get_state(self):
+        return self.game.state
+    def get_board(self):
+        """Get a read-only view of the current game board."""
+        return self.game.board.view()
+    def get_rem_mines(self):
+        """Get the number of mines not yet accounted for by flags."""
+        return self.nr_mines - self.nr_flags
+    def get_nbr_indices(self, x, y):
+        """Get the flat indices of the neighbours of the cell at (x, y) in the
+        current game, including the cell itself. The cached tables are too big
+        for huge boards, so the neighbours are found directly for those."""
+        X, Y = self.game.x_size, self.game.y_size
+        if self.game.huge:
+            return [j*X + i for i in range(max(0, x-1), min(X, x+2))
+                    for j in range(max(0, y-1), min(Y, y+2))]
+        return get_nbr_index_table(X, Y)[y*X + x]
+    def set_cell(self, x, y, state, count=0):
+        """Change a cell of the board, recording it to be sent in the next
+        update."""
+        self.game.board.set(x, y, state, count)
+        self.changed_cells.append((x, y))
+    def send_update(self):
+        """Send the cells changed by the current action in a single update,
+        followed by the end of the game if it has just ended."""
+        cells, self.changed_cells = self.changed_cells, []
+        if cells:
+            self.emit('update', cells)
+        if self.end_event:
+            event, self.end_event = self.end_event, None
+            self.emit(event)
+    def click(self, x, y):
+        self.click_cell(x, y)
+        if self.check_is_game_won():
+            self.finalise_win()
+        self.send_update()
+    def click_cells(self, coords):
+        """Click each of the given cells as a single action (e.g. for
+        automatic solving), stopping if the game ends."""
+        for (x, y) in coords:
+            self.click_cell(x, y)
+            if self.game.state == Game.LOST:
+                break
+            elif self.check_is_game_won():
+                self.finalise_win()
+                break
+        self.send_update()
+    def click_cell(self, x, y):
+        """Click the cell at (x, y), without checking for a win or sending the
+        update."""
+        board = self.game.board
+        if (board.get_state(x, y) != UNCLICKED
+            or self.game.state not in [Game.READY, Game.ACTIVE]):
+            return
+        if self.game.state == Game.READY:
+            X = self.game.x_size
+            safe_coords = []
+            if self.first_success:
+                safe_coords = [(k % X, k // X)
+                               for k in self.get_nbr_indices(x, y)]
+            self.game.start_game(safe_coords)
+            self.emit('start')
+        mf = self.game.mf
+        cell = mf.get_completed_cell(x, y)
+        if type(cell) is str:   # Mine hit, game over
+            self.set_cell(x, y, HIT, mf.get_mines(x, y))
+            self.finalise_loss()
+        elif cell == 0:         # Opening hit
+            for (x, y) in mf.get_opening(x, y):
+                if board.get_state(x, y) == UNCLICKED:
+                    self.set_cell(x, y, NUMBER, mf.get_completed_cell(x, y))
+                    self.game.cell_revealed(x, y)
+        else:                   # Number revealed
+            self.set_cell(x, y, NUMBER, cell)
+            self.game.cell_revealed(x, y)
+    def toggle_flag(self, x, y):
+        """Add a flag to an unclicked or flagged cell, or remove the flags if
+        it has the maximum number. Other cells are ignored."""
+        state, count = self.game.board.get(x, y)
+        if (state not in [UNCLICKED, FLAG]
+            or self.game.state not in [Game.READY, Game.ACTIVE]):
+            return
+        if state == UNCLICKED:
+            self.set_cell(x, y, FLAG, 1)
+            self.nr_flags += 1
+        elif count == self.game.per_cell:
+            self.set_cell(x, y, UNCLICKED)
+            self.nr_flags -= count
+        else:
+            self.set_cell(x, y, FLAG, count + 1)
+            self.nr_flags += 1
+        self.send_update()
+    def set_flags(self, flags):
+        """Set the number of flags in unclicked or flagged cells as a single
+        action, given a dictionary of the number of flags by coordinate (0 to
+        remove the flags)."""
+        if self.game.state not in [Game.READY, Game.ACTIVE]:
+            return
+        board = self.game.board
+        for (x, y), count in flags.items():
+            state, old_count = board.get(x, y)
+            if state == UNCLICKED:
+                old_count = 0
+            elif state != FLAG:
+                continue
+            if count != old_count:
+                self.set_cell(x, y, FLAG if count else UNCLICKED, count)
+                self.nr_flags += count - old_count
+        self.send_update()
+    def chord(self, x, y):
+        """Receive an attempt to chord at (x, y). If the number of flags is
+        correct, click the unclicked neighbours and return True, otherwise
+        return False."""
+        state, nr = self.game.board.get(x, y)
+        if state != NUMBER or self.game.state != Game.ACTIVE:
+            return False
+        codes = self.game.board.data
+        X = self.game.x_size
+        nbrs = self.get_nbr_indices(x, y)
+        nbr_flags = sum([codes[k] & COUNT_MASK for k in nbrs
+                         if codes[k] >> COUNT_BITS in (FLAG, LIFE)])
+        if nbr_flags == nr:
+            for k in nbrs:
+                if codes[k] >> COUNT_BITS == UNCLICKED:
+                    self.click_cell(k % X, k // X)
+                    if self.game.state == Game.LOST:
+                        break
+                    elif self.check_is_game_won():
+                        self.finalise_win()
+                        break
+            self.send_update()
+            return True
+        else:
+            return False
+    def check_is_game_won(self):
+        """The game is won once every safe cell has been revealed, which is
+        counted as cells are revealed."""
+        return self.game.state == Game.ACTIVE and self.game.rem_safe == 0
+    def finalise_loss(self):
+        self.game.state = Game.LOST
+        self.game.finalise()
+        board, mf = self.game.board, self.game.mf
+        for (x, y) in mf.get_mine_cells():
+            if board.get_state(x, y) == UNCLICKED:
+                self.set_cell(x, y, MINE, mf.get_mines(x, y))
+        for (x, y) in board.get_coords(FLAG):
+            count = board.get_count(x, y)
+            if count != mf.get_mines(x, y):
+                self.set_cell(x, y, CROSS, count)
+        self.end_event = 'lose'
+    def finalise_win(self):
+        self.game.state = Game.WON
+        self.game.finalise()
+        mf = self.game.mf
+        for (x, y) in mf.get_mine_cells():
+            if self.game.board.get_state(x, y) in (UNCLICKED, FLAG):
+                self.set_cell(x, y, FLAG, mf.get_mines(x, y))
+        self.end_event = 'win'
+
+class Game:
+    """Store attributes of a game such as the minefield, the start and end time
+    etc."""
+    READY = 'ready'
+    ACTIVE = 'active'
+    LOST = 'lost'
+    WON = 'won'
+    def __init__(self, engine):
+        self.engine = engine
+        for s in ['x_size', 'y_size', 'nr_mines', 'diff', 'per_cell']:
+            setattr(self, s, getattr(self.engine, s))
+        # Initialise the game board (all cells unclicked)
+        self.board = Board(self.x_size, self.y_size)
+        # Instantiate a new minefield, stored sparsely for huge boards
+        self.huge = self.x_size*self.y_size >= engine.huge_board_size
+        if self.huge:
+            self.mf = HugeMinefield(self.x_size, self.y_size,
+                                    memory_budget=engine.huge_memory_budget)
+        else:
+            self.mf = Minefield(self.x_size, self.y_size)
+        self.state = Game.READY
+        self.start_time = None
+    def __repr__(self):
+        if self.start_time:
+            return "<Game object, started at {}>".format(
+                tm.strftime('%H:%M, %d %b %Y', tm.localtime(self.start_time)))
+        else:
+            return "<Game object (not started)>"
+    def __str__(self):
+        ret = "Game:\n" + str(self.mf)
+        if self.start_time:
+            time = tm.strftime('%H:%M, %d %b %Y', tm.localtime(self.start_time))
+            ret += f"\nStarted at {time}."
+        return ret
+    def print_board(self):
+        replace = {0:'-', 'U':'#'}
+        if self.per_cell == 1:
+            for char in ['M', 'F', '!', 'X', 'L']:
+                replace[char + '1'] = char
+        print(prettify_grid(self.board.to_legacy(), replace))
+    def start_game(self, safe_coords=[]):
+        for s in ['first_success', 'drag_select', 'per_cell']:
+            setattr(self, s, getattr(self.engine, s))
+        self.mf.create(self.nr_mines, self.per_cell, safe_coords,
+                       self.engine.rng)
+        self.nr_safe = (self.x_size*self.y_size
+                        - len(self.mf.get_mine_cells()))
+        self.rem_safe = self.nr_safe
+        if self.huge:
+            # The 3bv would need the whole completed board
+            self.rem_3bv = None
+        else:
+            # Track the remaining 3bv as cells are revealed - each opening and
+            #  each safe cell not in an opening counts one until revealed.
+            self.rem_3bv = self.mf.bbbv
+            self.openings_found = set()
+            in_openings = set(self.mf.opening_cells)
+            self.isolated_cells = {c for c in self.mf.all_coords
+                                   if self.mf[c[1]][c[0]] == 0
+                                   and c not in in_openings}
+        self.state = Game.ACTIVE
+        self.start_time = tm.time()
+    def finalise(self):
+        assert self.state in [Game.WON, Game.LOST], "Can't finalise until game is over"
+        self.end_time = tm.time()
+        self.elapsed = self.end_time - self.start_time
+    def cell_revealed(self, x, y):
+        """Update the number of safe cells and the 3bv remaining for a newly
+        revealed safe cell."""
+        self.rem_safe -= 1
+        if self.huge:
+            return
+        opening_id = self.mf.opening_ids[y][x]
+        if opening_id >= 0:
+            if opening_id not in self.openings_found:
+                self.openings_found.add(opening_id)
+                self.rem_3bv -= 1
+        elif (x, y) in self.isolated_cells:
+            self.rem_3bv -= 1
+    def get_time_passed(self):
+        """Return the time in seconds since the game started (or the total time
+        if the game is finished), or None if it hasn't started."""
+        if self.state == Game.READY:
+            return None
+        elif self.state == Game.ACTIVE:
+            return tm.time() - self.start_time
+        else:
+            return self.elapsed
+    def get_rem_3bv(self):
+        """Return the minimum remaining number of clicks needed to solve, or
+        None if the game hasn't started (or the board is huge)."""
+        if self.state == Game.READY:
+            return None
+        return self.rem_3bv
+    def get_prop_complete(self):
+        """Calculate the progress of solving the board using 3bv."""
+        if self.state == Game.READY:
+            return 0
+        elif self.huge:
+            # Use the proportion of safe cells revealed instead
+            return 1 - self.rem_safe / self.nr_safe
+        return (self.mf.bbbv - self.rem_3bv) / self.mf.bbbv
+    def get_3bvps(self):
+        """Return the 3bv/s (or None for huge boards)."""
+        if self.state != Game.READY and not self.huge:
+            return (self.mf.bbbv - self.rem_3bv) / self.get_time_passed()
+    def get_predicted_time(self):
+        """Return the predicted time to complete the board in seconds, based on
+        the progress so far."""
+        prop = self.get_prop_complete()
+        if prop > 0:
+            return self.get_time_passed() / prop
@@ -14,11 +14,23 @@ from PyQt5.QtWidgets import *
 from PyQt5.QtGui import *
 from PyQt5.QtCore import *
 
-from utils import base_direc, img_direc, get_nbrs
-from highscores import (HighscoresWindow, get_hscore_position, enchs,
-                        include_old_hscores, save_all_highscores, LooseVersion)
+from utils import base_direc, img_direc, get_nbr_table
+from board import UNCLICKED, NUMBER, FLAG, MINE, HIT, LIFE, CROSS
+from engine import Game
+from highscores import (get_hscore_position, enchs, include_old_hscores,
+                        save_all_highscores)
 
 
+# Images used for the cells in each state of the game board.
+state_images = {
+    NUMBER: 'btn',
+    FLAG:   'flag',
+    MINE:   'mine',
+    HIT:    'hit',
+    CROSS:  'cross',
+    LIFE:   'life',
+    }
+
 def QMouseButton_to_int(QMouseButton):
     if QMouseButton == Qt.LeftButton:
         return int(Qt.LeftButton)
@@ -29,6 +41,8 @@ def QMouseButton_to_int(QMouseButton):
 
 
 class GameGUI(QMainWindow):
+    # Emitted (from the sampling thread) when the 3bv percentile is ready
+    percentileReady = pyqtSignal()
     def __init__(self, processor):
         global app
         app = QApplication(sys.argv)
@@ -42,11 +56,12 @@ class GameGUI(QMainWindow):
         # Disable maximise button
         self.setWindowFlags(self.windowFlags() | Qt.CustomizeWindowHint)
         self.setWindowFlags(self.windowFlags() & ~Qt.WindowMaximizeButtonHint)
-        # Create highscores window
-        self.hscores_window = HighscoresWindow(self)
-        self.hscores_window.setWindowIcon(self.icon)
+        # The highscores window is only created when it's first needed (see
+        #  get_hscores_window), to keep it out of the startup time.
+        self.hscores_window = None
         self.setupUI()
         self.open_windows = {'main': self}
+        self.percentileReady.connect(self.show_3bv_percentile)
     def setupUI(self):
         central_widget = QWidget(self)
         self.setCentralWidget(central_widget)
@@ -104,6 +119,15 @@ class GameGUI(QMainWindow):
         hs_act.triggered.connect(self.show_highscores)
         hs_act.setShortcut('F6')
         game_menu.addAction(hs_act)
+        # Auto solve actions
+        solve_act = QAction('Auto solve', self)
+        solve_act.triggered.connect(lambda: self.procr.auto_solve())
+        solve_act.setShortcut('F7')
+        game_menu.addAction(solve_act)
+        guess_act = QAction('Auto solve with guessing', self)
+        guess_act.triggered.connect(lambda: self.procr.auto_solve(guess=True))
+        guess_act.setShortcut('F8')
+        game_menu.addAction(guess_act)
         game_menu.addSeparator() #new section
         # Difficulty radiobuttons
         self.diff_group = QActionGroup(self, exclusive=True)
@@ -166,6 +190,15 @@ class GameGUI(QMainWindow):
         retrieve_act = QAction('Retrieve highscores', self)
         retrieve_act.triggered.connect(self.retrieve_highscores)
         help_menu.addAction(retrieve_act)
+    def get_hscores_window(self):
+        """Get the highscores window, creating it if it doesn't exist yet."""
+        if self.hscores_window is None:
+            from highscores_gui import HighscoresWindow
+            self.hscores_window = HighscoresWindow(self,
+                                                   self.procr.hscore_sort,
+                                                   self.procr.hscore_filters)
+            self.hscores_window.setWindowIcon(self.icon)
+        return self.hscores_window
     def resize(self):
         width = max(140, self.mf_widget.width()+20)
         height = (self.menubar.height() + self.panel.height()
@@ -186,53 +219,30 @@ class GameGUI(QMainWindow):
             self.namebar.focus_out()
             return
     def prepare_new_game(self):
+        board = self.procr.game.board
+        if (board.x_size, board.y_size) != (self.mf_widget.x_size,
+                                            self.mf_widget.y_size):
+            # The new game has a different size (e.g. a new difficulty)
+            self.mf_widget.reshape(board.x_size, board.y_size)
+            self.resize()
         self.timer.stop()
         self.timer.label.setText('000')
-        for (x, y) in self.mf_widget.all_coords:
-            self.mf_widget.buttons[y][x].refresh()
+        self.update_cells(self.mf_widget.all_coords)
         self.set_face('ready')
-        self.set_mines_counter()
+        self.face_button.setToolTip('')
         if 'highscores' in self.open_windows:
             self.open_windows['highscores'].model.set_current_hscore(None)
     def start_game(self):
         self.timer.start()
-    def reveal_cell(self, x, y):
-        """Make the cell at (x, y) show the same as is contained in the current
-        game board."""
-        b = self.mf_widget.buttons[y][x]
-        contents = self.procr.game.board[y][x]
-        if type(contents) is int:
-            im_type = 'btn'
-            num = contents
-        elif type(contents) is str:
-            char = contents[0]
-            num = int(contents[1])
-            # [Put these in a dictionary in utils?]
-            if char == 'F':
-                im_type = 'flag'
-            elif char == 'M':
-                im_type = 'mine'
-            elif char == '!':
-                im_type = 'hit'
-            elif char == 'X':
-                im_type = 'cross'
-            elif char == 'L':
-                im_type = 'life'
-        b.set_image(im_type, num)
-    def flag(self, x, y, n):
-        b = self.mf_widget.buttons[y][x]
-        b.setPixmap(self.mf_widget.flag_images[n])
-        rem_mines = self.procr.nr_mines - self.procr.nr_flags
-        self.set_mines_counter()
-        if n == 1:
-            b.pressed.disconnect()
-            b.released.disconnect()
-            b.clicked.disconnect()
-            b.areaPressed.disconnect()
-            b.areaReleased.disconnect()
-    def unflag(self, x, y):
-        b = self.mf_widget.buttons[y][x]
-        b.refresh()
+    def update_cells(self, cells):
+        """Make the given cells show the same as is contained in the current
+        game board, repainting the minefield only once at the end."""
+        board = self.procr.game.board
+        buttons = self.mf_widget.buttons
+        self.mf_widget.setUpdatesEnabled(False)
+        for (x, y) in cells:
+            buttons[y][x].setPixmap(self.mf_widget.get_image(*board.get(x, y)))
+        self.mf_widget.setUpdatesEnabled(True)
         self.set_mines_counter()
     def set_mines_counter(self):
         rem_mines = self.procr.nr_mines - self.procr.nr_flags
@@ -251,7 +261,7 @@ class GameGUI(QMainWindow):
                                                 padding-left: 1px;""")
     def set_face(self, state, check_game_state=False):
         if (check_game_state and
-            self.procr.game.state not in ['ready', 'active']):
+            self.procr.game.state not in [Game.READY, Game.ACTIVE]):
             return False
         life = 1
         fname = 'face' + str(life) + state + '.png'
@@ -263,26 +273,17 @@ class GameGUI(QMainWindow):
         self.set_face('lost')
         self.timer.stop()
         self.timer.set_time(self.procr.game.elapsed)
-        for (x, y) in self.mf_widget.all_coords:
-            b = self.mf_widget.buttons[y][x]
-            b.remove_interaction()
-            board_cell = self.procr.game.board[y][x]
-            if str(board_cell)[0] in ['M', '!', 'X']:
-                self.reveal_cell(x, y)
     def finalise_win(self):
         self.set_face('won')
         self.set_mines_counter()
         self.timer.stop()
         self.timer.set_time(self.procr.game.elapsed)
         # self.timer.set_time(self.procr.game.)
-        for (x, y) in self.mf_widget.all_coords:
-            b = self.mf_widget.buttons[y][x]
-            b.remove_interaction()
-            n = self.procr.game.mf[y][x]
-            if n > 0:
-                self.reveal_cell(x, y)
+        self.show_3bv_percentile()
+        if self.procr.hscore is None:
+            return # Game not eligible for the highscores
         filters = self.procr.hscore_filters.copy()
-        model = self.hscores_window.model
+        model = self.get_hscores_window().model
         if not self.procr.name:
             # popup
             pass
@@ -304,13 +305,22 @@ class GameGUI(QMainWindow):
             # Show highscores for current name if there's any name filter
             if self.procr.hscore_filters['name']:
                 model.apply_filters({'name': self.procr.name}, temp=True)
+    def bbbv_percentile_ready(self):
+        """Called from the sampling thread, so the percentile is shown by the
+        main thread via a signal."""
+        self.percentileReady.emit()
+    def show_3bv_percentile(self):
+        if self.procr.bbbv_percentile is not None:
+            self.face_button.setToolTip(
+                "3bv {}, harder than {:.0f}% of boards".format(
+                    self.procr.game.mf.get_3bv(), self.procr.bbbv_percentile))
     def show_highscores(self, event=None, sort_by=None, filters=None):
         """Show the highscores window (or update if already open)."""
-        if self.procr.game.state == 'ready':
+        if self.procr.game.state == Game.READY:
             settings_source = self.procr
         else:
             settings_source = self.procr.game
-        self.hscores_window.model.update_hscores_group(settings_source)
+        self.get_hscores_window().model.update_hscores_group(settings_source)
         # self.hscores_window.model.set_current_hscore(self.procr.hscore)
         self.hscores_window.show()
         self.open_windows['highscores'] = self.hscores_window
@@ -335,11 +345,8 @@ class GameGUI(QMainWindow):
                 if action.id == self.procr.diff:
                     action.setChecked(True)
             return
+        # The minefield is reshaped when the new game is prepared
         self.procr.change_difficulty(diff)
-        x, y = self.procr.x_size, self.procr.y_size
-        self.mf_widget.reshape(x, y)
-        self.resize()
-        self.prepare_new_game()
     def toggle_drag_select(self):
         self.procr.change_setting('drag_select', not(self.procr.drag_select))
     def change_per_cell(self):
@@ -347,6 +354,7 @@ class GameGUI(QMainWindow):
                                   self.per_cell_group.checkedAction().num)
     def retrieve_highscores(self):
         """Add highscores from another distribution without performing checks."""
+        from distutils.version import LooseVersion # slow to import
         #[Improve by giving error message before closing selection popup]
         options = {
             'parent': self,
@@ -474,6 +482,12 @@ class MinefieldWidget(QWidget):
                     'markers', 'flag{}.png'.format(i), 5/8))
                 self.cross_images.append(self.make_pixmap('btn_up.png',
                     'markers', 'cross{}.png'.format(i), 5/8))
+    def get_image(self, state, num):
+        """Get the image for a cell with the given state and count on the game
+        board."""
+        if state == UNCLICKED:
+            return self.btn_images['up']
+        return getattr(self, state_images[state] + '_images')[num]
     def mousePressEvent(self, event):
         self.gui.focus_to_game()
         x, y = event.x() // self.gui.btn_size, event.y() // self.gui.btn_size
@@ -537,10 +551,12 @@ class MinefieldWidget(QWidget):
                 elif event.buttons() == Qt.LeftButton | Qt.RightButton:
                     self.sink_area(x, y)
     def sink_area(self, x, y):
-        for (i, j) in get_nbrs(x, y, self.x_size, self.y_size):
+        nbr_table = get_nbr_table(self.x_size, self.y_size)
+        for (i, j) in nbr_table[y*self.x_size + x]:
             self.buttons[j][i].areaPressed.emit()
     def raise_area(self, x, y):
-        for (i, j) in get_nbrs(x, y, self.x_size, self.y_size):
+        nbr_table = get_nbr_table(self.x_size, self.y_size)
+        for (i, j) in nbr_table[y*self.x_size + x]:
             self.buttons[j][i].areaReleased.emit()
     def reshape(self, x_size, y_size):
         old_x, old_y = self.x_size, self.y_size
@@ -584,45 +600,44 @@ class CellButton(QLabel):
         self.procr = parent.procr
         # self.setFixedSize(self.gui.btn_size, self.gui.btn_size)
         self.x, self.y = x, y
+        self.pressed.connect(self.press)
+        self.released.connect(self.release)
+        self.clicked.connect(self.click)
+        self.rightPressed.connect(self.rightPress)
+        self.areaPressed.connect(self.areaPress)
+        self.areaReleased.connect(self.release)
+    def is_active(self):
+        """Whether the button responds to the left mouse button, which is the
+        case while it's unclicked and the game isn't over. This is checked
+        against the game board rather than connecting and disconnecting the
+        signals as the board changes."""
+        return (self.procr.game.state in [Game.READY, Game.ACTIVE]
+                and self.procr.game.board.get_state(self.x, self.y) == UNCLICKED)
     def press(self):
+        if not self.is_active():
+            return
         if self.procr.drag_select:
             self.procr.click(self.x, self.y)
         else:
             self.gui.set_face('active')
             self.setPixmap(self.parent.btn_images['down'])
     def release(self):
+        if not self.is_active():
+            return
         self.gui.set_face('ready')
         self.setPixmap(self.parent.btn_images['up'])
     def click(self):
+        if not self.is_active():
+            return
         self.gui.set_face('ready')
         self.procr.click(self.x, self.y)
     def rightPress(self):
         self.procr.toggle_flag(self.x, self.y)
     def areaPress(self):
+        if not self.is_active():
+            return
         self.gui.set_face('active')
         self.setPixmap(self.parent.btn_images['down'])
-    def refresh(self):
-        self.setPixmap(self.parent.btn_images['up'])
-        # First remove connections so that signals are only connected once.
-        self.remove_interaction()
-        self.pressed.connect(self.press)
-        self.released.connect(self.release)
-        self.clicked.connect(self.click)
-        self.rightPressed.connect(self.rightPress)
-        self.areaPressed.connect(self.areaPress)
-        self.areaReleased.connect(self.release)
-    def remove_interaction(self):
-        """Remove all connected signals for interation through clicks."""
-        for signal in ['pressed', 'released', 'clicked', 'rightPressed',
-                       'areaPressed', 'areaReleased']:
-            try:
-                getattr(self, signal).disconnect()
-            except TypeError:
-                pass # Already disconnected
-    def set_image(self, im_type, num):
-        self.remove_interaction()
-        images = getattr(self.parent, im_type + '_images')
-        self.setPixmap(images[num])
 
 class TopPanel(QAbstractButton):
     def __init__(self, parent, gui):
@@ -717,13 +732,14 @@ class NameBar(QLineEdit):
             h['name'] = procr.name
             h['key'] = enchs(procr.game, h)
             if procr.name:
-                self.gui.hscores_window.model.set_current_hscore(h)
+                self.gui.get_hscores_window().model.set_current_hscore(h)
             else:
-                self.gui.hscores_window.model.set_current_hscore(None)
+                self.gui.get_hscores_window().model.set_current_hscore(None)
         if procr.hscore_filters['name']:# == old_name:
             # Change highscores name filter to new name
             # Satisfies case of temporary name filter too
-            self.gui.hscores_window.model.apply_filters({'name': procr.name})
+            self.gui.get_hscores_window().model.apply_filters(
+                {'name': procr.name})
     def mouseDoubleClickEvent(self, event):
         self.selectAll()
         self.setFocus()
@@ -0,0 +1,176 @@
+"""
+Sparse minefields for boards far larger than the standard difficulties (e.g.
+for endurance and stress boards of 1000 x 1000 cells or more).
+
+The mines are stored as a sorted array of flat cell indices, and the numbers
+of the completed board are only calculated when they're needed, one square
+tile at a time. Calculated tiles are kept in a least-recently-used cache whose
+size is limited by a configurable memory budget. Openings are found by flood
+filling from the clicked cell across as many tiles as necessary.
+"""
+
+import random as rnd
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+
+from minefield import nbr_sums, get_mine_counts, load_numpy
+from utils import has_numpy
+
+
+class HugeMinefield:
+    # Tile cells containing mines store this flag plus the number of mines.
+    MINE = 0x80
+    def __init__(self, x_size, y_size, tile_size=64, memory_budget=2**26):
+        """The memory budget is the maximum number of bytes to use for cached
+        tiles of the completed board."""
+        self.x_size, self.y_size = x_size, y_size
+        self.tile_size = tile_size
+        self.memory_budget = memory_budget
+        self.max_tiles = max(1, memory_budget // tile_size**2)
+        self.nr_mines = 0
+        self.per_cell = 1
+        self.mines = array('q') # sorted flat indices, repeated per mine
+        self.tiles = OrderedDict()
+    def __repr__(self):
+        mines = " with {} mines".format(self.nr_mines) if self.nr_mines else ""
+        return "<{}x{} huge minefield{}>".format(self.x_size, self.y_size, mines)
+    def create_from_list(self, coords):
+        assert len(self.mines) == 0, "Minefield already created."
+        self.mines = array('q', sorted(y*self.x_size + x for (x, y) in coords))
+        self.nr_mines = len(self.mines)
+        self.tiles.clear()
+    def create(self, nr_mines, per_cell=1, safe_coords=[], rng=None):
+        """Randomly place the mines, avoiding safe_coords. The argument rng can
+        be a random.Random instance or a seed to create one with, otherwise
+        the global random state is used."""
+        assert len(self.mines) == 0, "Minefield already created."
+        if rng is None:
+            rng = rnd
+        elif not isinstance(rng, rnd.Random):
+            rng = rnd.Random(rng)
+        safe_cells = sorted({y*self.x_size + x for (x, y) in safe_coords})
+        nr_avble = self.x_size*self.y_size - len(safe_cells)
+        assert nr_mines <= nr_avble * per_cell, (
+            "Too many mines ({}) for grid with dimensions {} x {}.".format(
+                nr_mines, self.x_size, self.y_size))
+        self.per_cell = per_cell
+        # Choose the numbers of mines as in Minefield.create and the available
+        #  cells to put them in, then map the chosen cells onto the board by
+        #  skipping the safe cells.
+        counts = get_mine_counts(nr_avble, nr_mines, per_cell, rng)
+        chosen = rng.sample(range(nr_avble), len(counts))
+        cells = sorted(c for c, n in zip(chosen, counts) for i in range(n))
+        mines = array('q')
+        i = 0
+        for c in cells:
+            while i < len(safe_cells) and safe_cells[i] <= c + i:
+                i += 1
+            mines.append(c + i)
+        self.mines = mines
+        self.nr_mines = nr_mines
+        self.tiles.clear()
+    def get_mines(self, x, y):
+        """Get the number of mines in the cell at (x, y)."""
+        c = y*self.x_size + x
+        return bisect_right(self.mines, c) - bisect_left(self.mines, c)
+    def get_mine_cells(self):
+        """Get the set of coordinates of the cells containing mines."""
+        X = self.x_size
+        return {(c % X, c // X) for c in self.mines}
+    def get_tile(self, tx, ty):
+        """Get the completed board for the tile with the given tile indices,
+        as a bytearray indexed by (y - y0)*tile_size + (x - x0). Mines are
+        stored as MINE plus the number of mines, other cells as the number of
+        neighbouring mines."""
+        key = (tx, ty)
+        if key in self.tiles:
+            self.tiles.move_to_end(key)
+            return self.tiles[key]
+        T = self.tile_size
+        x0, y0 = tx*T, ty*T
+        x1, y1 = min(x0 + T, self.x_size), min(y0 + T, self.y_size)
+        if has_numpy:
+            tile = self.calc_tile_array(x0, y0, x1, y1)
+        else:
+            tile = self.calc_tile(x0, y0, x1, y1)
+        self.tiles[key] = tile
+        if len(self.tiles) > self.max_tiles:
+            self.tiles.popitem(last=False)
+        return tile
+    def calc_tile(self, x0, y0, x1, y1):
+        """Calculate the completed board for the tile between the given
+        coordinates (see get_tile)."""
+        T = self.tile_size
+        tile = bytearray(T*T)
+        # Add each mine in or next to the tile to its neighbours in the tile.
+        for j in range(max(0, y0 - 1), min(self.y_size, y1 + 1)):
+            row_start = j*self.x_size
+            lo = bisect_left(self.mines, row_start + max(0, x0 - 1))
+            hi = bisect_left(self.mines, row_start + min(self.x_size, x1 + 1))
+            for c in self.mines[lo:hi]:
+                i = c - row_start
+                for y in range(max(y0, j - 1), min(y1, j + 2)):
+                    for x in range(max(x0, i - 1), min(x1, i + 2)):
+                        tile[(y - y0)*T + x - x0] += 1
+        # Replace the counts in mine cells with the mine markers.
+        for j in range(y0, y1):
+            row_start = j*self.x_size
+            lo = bisect_left(self.mines, row_start + x0)
+            hi = bisect_left(self.mines, row_start + x1)
+            for c in set(self.mines[lo:hi]):
+                n = bisect_right(self.mines, c) - bisect_left(self.mines, c)
+                tile[(j - y0)*T + c - row_start - x0] = self.MINE | n
+        return tile
+    def calc_tile_array(self, x0, y0, x1, y1):
+        """Array-backed equivalent of calc_tile."""
+        np = load_numpy()
+        T, X = self.tile_size, self.x_size
+        # Mines in the rows of the tile and the rows either side are contiguous
+        #  in the sorted flat indices.
+        wy0, wy1 = max(0, y0 - 1), min(self.y_size, y1 + 1)
+        lo = bisect_left(self.mines, wy0*X)
+        hi = bisect_left(self.mines, wy1*X)
+        mines = np.frombuffer(self.mines, dtype=np.int64)[lo:hi]
+        xs, ys = mines % X, mines // X
+        # Count the mines in each cell of the tile plus a border of one cell.
+        in_window = (xs >= x0 - 1) & (xs <= x1)
+        window = np.bincount((ys[in_window] - y0 + 1) * (T + 2)
+                             + xs[in_window] - x0 + 1,
+                             minlength=(T + 2)**2).reshape(T + 2, T + 2)
+        counts = nbr_sums(window)[1:-1, 1:-1]
+        inner = window[1:-1, 1:-1]
+        tile = np.where(inner > 0, self.MINE | inner, counts).astype(np.uint8)
+        # Clear the cells beyond the edge of the board.
+        tile[y1 - y0:, :] = 0
+        tile[:, x1 - x0:] = 0
+        return bytearray(tile.tobytes())
+    def get_completed_cell(self, x, y):
+        """Get the contents of the cell at (x, y) in the completed board, in
+        the same form as Minefield.completed_board."""
+        T = self.tile_size
+        val = self.get_tile(x // T, y // T)[(y % T)*T + x % T]
+        if val & self.MINE:
+            return 'F' + str(val & ~self.MINE)
+        return val
+    def get_opening(self, x, y):
+        """Get the sorted coordinates revealed by clicking the zero cell at
+        (x, y), found by flood filling from that cell."""
+        T = self.tile_size
+        opening = {(x, y)}
+        check = [(x, y)]
+        while check:
+            cx, cy = check.pop()
+            for i in range(max(0, cx - 1), min(self.x_size, cx + 2)):
+                for j in range(max(0, cy - 1), min(self.y_size, cy + 2)):
+                    if (i, j) in opening:
+                        continue
+                    opening.add((i, j))
+                    if self.get_tile(i // T, j // T)[(j % T)*T + i % T] == 0:
+                        check.append((i, j))
+        return sorted(opening)
+    def get_memory_usage(self):
+        """Get the approximate number of bytes used by the mines and the
+        cached tiles."""
+        return (self.mines.itemsize * len(self.mines)
+                + self.tile_size**2 * len(self.tiles))
@@ -1,7 +1,8 @@
 """
 Entry point for playing the game.
 
-The following character representations are used:
+The game board is stored compactly (see board.py). The following character
+representations are used when printing it:
     'U' - unclicked
     'F' - flag
     'M' - mine
@@ -12,172 +13,196 @@ The following character representations are used:
 
 import sys
 from os.path import join
-import time as tm
 import json
 
-from minefield import Minefield
-from utils import (get_nbrs, prettify_grid, diff_values, default_settings,
-                   base_direc, file_direc, __version__, IN_EXE)
+from engine import Engine, Game
+from board import FLAG
+from utils import default_settings, file_direc, __version__, IN_EXE
 # import highscores as hs
-from highscores import (enchs, get_highscores,
-                        settings_keys as hscore_group_keys)
-# from solver.probabilities import ProbsGrid
+from highscores import enchs, get_highscores, get_3bv_percentile
 
-# Determine which UI to use
-if '--cli' in sys.argv:
-    sys.argv.remove('--cli')
-    from cli import GameCLI as GameUI
-    from cli import HighscoresModel, save_all_highscores
-else:
-    from gui import GameGUI as GameUI
-    from highscores import HighscoresModel, save_all_highscores
+
+def get_ui(name):
+    """Import the user interface with the given name ('gui' or 'cli'), returning
+    its game UI class and function for saving highscores."""
+    if name == 'cli':
+        from cli import GameCLI as GameUI
+        from cli import save_all_highscores
+    else:
+        from gui import GameGUI as GameUI
+        from highscores import save_all_highscores
+    return GameUI, save_all_highscores
 
 
 
 class Processor:
-    def __init__(self, **settings):
-        self.settings = settings.keys()
+    """Connect a user interface to the game engine, which holds the settings
+    and state of the current game, and keep track of the highscores."""
+    # Limits on the boards sampled in the background to estimate a 3bv
+    #  distribution that isn't cached (see get_3bv_percentile).
+    min_3bv_samples = 100
+    max_3bv_sample_cells = 10**6
+    def __init__(self, ui='gui', start=True, **settings):
+        """If start is False the UI is created but not started (e.g. its
+        main loop isn't entered)."""
+        self.settings = list(settings.keys())
+        # Created when first needed (see get_solver)
+        self.solver = None
+        # Whether the solver has been used to play the current game
+        self.solver_used = False
+        # Percentile of the 3bv of the last game won (see get_3bv_percentile)
+        self.bbbv_percentile = None
+        # Thread for sampling 3bv distributions, created when first needed
+        self.bbbv_executor = None
+        self.engine = Engine(**{s: settings[s] for s in Engine.settings_keys
+                                if s in settings})
         for attr in settings:
-            setattr(self, attr, settings[attr])
-        for d in diff_values:
-            if diff_values[d] == (self.x_size, self.y_size, self.nr_mines):
-                self.diff = d
-                break
-        else:
-            self.diff = 'c'
+            if attr not in Engine.settings_keys + ['diff']:
+                setattr(self, attr, settings[attr])
+        GameUI, self.save_all_highscores = get_ui(ui)
         self.ui = GameUI(self)
+        for event, func in [('new_game', self.new_game_prepared),
+                            ('start', self.ui.start_game),
+                            ('update', self.ui.update_cells),
+                            ('lose', self.ui.finalise_loss),
+                            ('win', self.finalise_win)]:
+            self.engine.add_callback(event, func)
         # Get the existing highscores for the current settings
         self.current_hscores = get_highscores(self)
         self.prepare_new_game()
-        self.ui.start()
+        if start:
+            self.ui.start()
+    def __getattr__(self, attr):
+        # The game settings and the current game are held by the engine.
+        if attr == 'engine':
+            raise AttributeError(attr)
+        return getattr(self.engine, attr)
     def change_difficulty(self, diff, x_size=None, y_size=None, nr_mines=None):
         """Change difficulty, creating a new game with new settings. Arguments
         x_size, y_size, nr_mines are ignored unless diff=='c'."""
-        if diff == 'c':
-            for d in diff_values:
-                if diff_values[d] == (x_size, y_size, nr_mines):
-                    self.change_difficulty(d)
-                    return
-            self.x_size, self.y_size = x_size, y_size
-            self.nr_mines = nr_mines
-            self.diff = 'c'
-        elif diff in diff_values:
-            self.x_size, self.y_size, self.nr_mines = diff_values[diff]
-            self.diff = diff
-        else:
-            raise ValueError('Invalid difficulty character, {}.'.format(diff))
-        self.prepare_new_game()
+        self.engine.change_difficulty(diff, x_size, y_size, nr_mines)
     def change_setting(self, setting, value):
-        setattr(self, setting, value)
+        if setting in Engine.settings_keys:
+            self.engine.change_setting(setting, value)
+        else:
+            setattr(self, setting, value)
         if self.game.state == Game.READY:
             # If game isn't active update current highscores for new settings
             self.current_hscores = get_highscores(self)
     def prepare_new_game(self):
-        self.nr_flags = 0
+        self.engine.new_game()
+    def new_game_prepared(self):
         self.ui.prepare_new_game()
-        self.game = Game(self)
         # Update highscores for new settings (in case game was active when the
         #  settings were changed).
         self.current_hscores = get_highscores(self)
         self.hscore = None
-    def click(self, x, y, check_for_win=True):
-        if self.game.board[y][x] != 'U':
-            return
-        if self.game.state == Game.READY:
-            safe_coords = (get_nbrs(x, y, self.x_size, self.y_size)
-                           if self.first_success else [])
-            self.game.start_game(safe_coords)
-            self.ui.start_game()
-        cell = self.game.mf.completed_board[y][x]
-        if type(cell) is str:   # Mine hit, game over
-            self.game.board[y][x] = '!' + str(self.game.mf[y][x])
-            # self.ui.reveal_cell(x, y)
-            self.finalise_loss()
-            return      # No need to check for win
-        elif cell == 0:         # Opening hit
-            for opening in self.game.mf.openings:
-                if (x, y) in opening:
-                    break # Work with this set of coords
-            for (x, y) in opening:
-                if self.game.board[y][x] == 'U':
-                    self.game.board[y][x] = self.game.mf.completed_board[y][x]
-                    self.ui.reveal_cell(x, y)
-        else:                   # Number revealed
-            self.game.board[y][x] = self.game.mf.completed_board[y][x]
-            self.ui.reveal_cell(x, y)
-        if check_for_win and self.check_is_game_won():
-            self.finalise_win()
+        self.bbbv_percentile = None
+        self.solver_used = False
+    def click(self, x, y):
+        self.engine.click(x, y)
     def toggle_flag(self, x, y):
-        """The given cell must either be unclicked or flagged (otherwise it is
-        unclickable)."""
-        val = self.game.board[y][x]
-        if val == 'U':
-            self.game.board[y][x] = 'F1'
-            self.nr_flags += 1
-            self.ui.flag(x, y, 1)
-        elif val == 'F' + str(self.per_cell):
-            self.game.board[y][x] = 'U'
-            self.nr_flags -= self.per_cell
-            self.ui.unflag(x, y)
-        else:
-            flags = int(val[1]) + 1
-            self.game.board[y][x] = 'F' + str(flags)
-            self.nr_flags += 1
-            self.ui.flag(x, y, flags)
+        self.engine.toggle_flag(x, y)
     def chord(self, x, y):
-        """Receive an attempt to chord at (x, y). If the number of flags is
-        correct, return True and send the required signals to the UI, otherwise
-        return False."""
-        state = self.game.board[y][x]
-        if type(state) is not int:
-            return False
-        nbrs = get_nbrs(x, y, self.x_size, self.y_size)
-        nbr_flags = sum([int(self.game.board[j][i][1]) for (i, j) in nbrs
-                         if str(self.game.board[j][i])[0] in ['F', 'L']])
-        if nbr_flags == state:
-            for (i, j) in nbrs:
-                if self.game.board[j][i] == 'U':
-                    self.click(i, j, check_for_win=False)
-                    if self.check_is_game_won():
-                        self.finalise_win()
-                    # self.ui.reveal_cell(i, j)
-            return True
-        else:
-            return False
-    def check_is_game_won(self):
-        for (x, y) in self.game.mf.all_coords:
-            if self.game.board[y][x] == 'U' and self.game.mf[y][x] == 0:
-                return False
-        return True
-    def finalise_loss(self):
-        self.game.state = Game.LOST
-        self.game.finalise()
-        for (x, y) in self.game.mf.all_coords:
-            board_cell = self.game.board[y][x]
-            mines = self.game.mf[y][x]
-            if mines > 0 and board_cell == 'U':
-                self.game.board[y][x] = 'M' + str(mines)
-            elif (str(board_cell)[0] == 'F'
-                  and board_cell != self.game.mf.completed_board[y][x]):
-                self.game.board[y][x] = 'X' + board_cell[1]
-        # print(prettify_grid(self.game.board))
-        self.ui.finalise_loss()
+        return self.engine.chord(x, y)
     def finalise_win(self):
-        self.game.state = Game.WON
-        self.game.finalise()
-        for (x, y) in self.game.mf.all_coords:
-            mines = self.game.mf[y][x]
-            if mines > 0 and self.game.board[y][x][0] in ['U','F']:
-                self.game.board[y][x] = 'F' + str(mines)
-        if self.diff != 'c':
+        if self.diff != 'c' and not self.solver_used:
             # Add completed game to highscores
-            self.hscore = self.game.get_highscore()
+            self.hscore = self.get_highscore()
             self.current_hscores.append(self.hscore)
+        self.bbbv_percentile = self.get_3bv_percentile()
         self.ui.finalise_win()
+    def get_3bv_percentile(self):
+        """Get the percentile of the current game's 3bv among boards with the
+        same settings from the cached distributions. If the distribution isn't
+        cached (e.g. for custom boards), a limited number of boards are sampled
+        in the background to estimate it and the UI is told when the
+        percentile is ready, so the win isn't held up. Return None if it isn't
+        ready, or for huge boards, which have no 3bv."""
+        if self.game.huge:
+            return None
+        h = {'3bv': self.game.mf.get_3bv()}
+        percentile = get_3bv_percentile(h, self.game)
+        if percentile is None:
+            if self.bbbv_executor is None:
+                # Imported here as it's rarely needed.
+                from concurrent.futures import ThreadPoolExecutor
+                self.bbbv_executor = ThreadPoolExecutor(1)
+            game = self.game
+            nr_samples = max(self.min_3bv_samples, self.max_3bv_sample_cells
+                             // (game.x_size * game.y_size))
+            future = self.bbbv_executor.submit(get_3bv_percentile, h, game,
+                                               True, nr_samples=nr_samples)
+            future.add_done_callback(
+                lambda f: self.set_3bv_percentile(game, f.result()))
+        return percentile
+    def set_3bv_percentile(self, game, percentile):
+        """Receive the 3bv percentile of a game from the sampling thread, and
+        pass it on to the UI if the game is still the current one."""
+        if game is self.game:
+            self.bbbv_percentile = percentile
+            self.ui.bbbv_percentile_ready()
+    def get_highscore(self):
+        h = {'name':     self.name,
+             'time':     round(self.game.elapsed * 1000),
+             '3bv':      self.game.mf.get_3bv(),
+             'date':     int(self.game.end_time),
+             'flagging': 'F' if bool(self.nr_flags) else 'NF'
+             }
+        h['key'] = enchs(self.game, h)
+        return h
+    def get_solver(self):
+        if self.solver is None:
+            from solver.probabilities import GameSolver
+            # Flags are ignored so that wrongly placed flags can be corrected
+            self.solver = GameSolver(self.engine, ignore_flags=True)
+        return self.solver
     def calculate_probs(self):
-        print(ProbsGrid(board, **settings))
+        probs = self.get_solver().get_probs()
+        print(probs)
+        return probs
+    def auto_solve(self, guess=False):
+        """Flag the cells that are certainly mines and click the cells that
+        are certainly safe, repeating until no more cells are certain. If
+        guess is True, carry on by clicking the cell least likely to be a mine
+        until the game is over."""
+        while self.game.state in [Game.READY, Game.ACTIVE]:
+            if self.game.state == Game.READY and not guess:
+                return
+            self.solver_used = True
+            board = self.game.board
+            before = bytes(board.data)
+            guess_coord = None
+            if self.game.state == Game.READY:
+                guess_coord = (self.game.x_size // 2, self.game.y_size // 2)
+            else:
+                probs = self.get_solver().get_probs()
+                safe, mines = probs.get_certain_cells()
+                # Correct any flags, then click the safe cells in a single
+                #  action
+                flags = {c: n for c, n in mines.items()
+                         if board.get(*c) != (FLAG, n)}
+                flags.update({c: 0 for c in safe
+                              if board.get_state(*c) == FLAG})
+                if flags:
+                    self.engine.set_flags(flags)
+                if safe:
+                    self.engine.click_cells(safe)
+                elif guess:
+                    # The cells to guess from include flagged cells, as the
+                    #  solver ignores flags
+                    guess_coord = min([c for c in probs.clickable_coords
+                                       if c not in mines],
+                                      key=lambda c: probs[c[1]][c[0]],
+                                      default=None)
+            if guess_coord is not None:
+                if board.get_state(*guess_coord) == FLAG:
+                    self.engine.set_flags({guess_coord: 0})
+                self.engine.click(*guess_coord)
+            if bytes(board.data) == before:
+                break # Nothing more can be done
     def close_game(self):
-        save_all_highscores()
+        self.save_all_highscores()
         self.save_settings()
     def save_settings(self):
         settings = {}
@@ -187,100 +212,22 @@ class Processor:
             json.dump(settings, f)
 
 
-class Game:
-    """Store attributes of a game such as the minefield, the start and end time
-    etc."""
-    READY = 'ready'
-    ACTIVE = 'active'
-    LOST = 'lost'
-    WON = 'won'
-    def __init__(self, processor):
-        self.procr = processor
-        for s in ['x_size', 'y_size', 'nr_mines', 'diff']:
-            setattr(self, s, getattr(self.procr, s))
-        # Initialise the game board (all cells unclicked)
-        self.board = []
-        for j in range(self.y_size):
-            self.board.append(self.x_size*['U'])
-        # Instantiate a new minefield
-        self.mf = Minefield(self.x_size, self.y_size)
-        self.state = Game.READY
-        self.start_time = None
-    def __repr__(self):
-        if self.start_time:
-            return "<Game object, started at {}>".format(
-                tm.strftime('%H:%M, %d %b %Y', tm.localtime(self.start_time)))
-        else:
-            return "<Game object (not started)>"
-    def __str__(self):
-        ret = "Game:\n" + str(self.mf)
-        if self.start_time:
-            time = tm.strftime('%H:%M, %d %b %Y', tm.localtime(self.start_time))
-            ret += f"\nStarted at {time}."
-        return ret
-    def print_board(self):
-        replace = {0:'-', 'U':'#'}
-        if self.per_cell == 1:
-            for char in ['M', 'F', '!', 'X', 'L']:
-                replace[char + '1'] = char
-        print(prettify_grid(self.board, replace))
-    def start_game(self, safe_coords=[]):
-        for s in ['first_success', 'drag_select', 'per_cell']:
-            setattr(self, s, getattr(self.procr, s))
-        self.mf.create(self.nr_mines, self.per_cell, safe_coords)
-        self.state = Game.ACTIVE
-        self.start_time = tm.time()
-    def finalise(self):
-        assert self.state in [Game.WON, Game.LOST], "Can't finalise until game is over"
-        self.end_time = tm.time()
-        self.elapsed = self.end_time - self.start_time
-    def get_highscore(self):
-        h = {'name':     self.procr.name,
-             'time':     round(self.elapsed * 1000),
-             '3bv':      self.mf.get_3bv(),
-             'date':     int(self.end_time),
-             'flagging': 'F' if bool(self.procr.nr_flags) else 'NF'
-             }
-        h['key'] = enchs(self, h)
-        return h
-    #[Check the following methods]
-    def get_rem_3bv(self):
-        """Calculate the minimum remaining number of clicks needed to solve."""
-        if self.state == Game.WON:
-            return 0
-        elif self.state == Game.READY:
-            return self.mf.bbbv
-        else:
-            t = tm.time()
-            lost_mf = Minefield(auto_create=False, **self.settings)
-            lost_mf.mine_coords = self.mf.mine_coords
-            # Replace any openings already found with normal clicks (ones).
-            lost_mf.completed_grid = np.where(self.grid<0,
-                self.mf.completed_grid, 1)
-            # Find the openings which remain.
-            lost_mf.get_openings()
-            rem_opening_coords = [c for opening in lost_mf.openings
-                for c in opening]
-            # Count the number of essential clicks that have already been
-            # done by counting clicked cells minus the ones at the edge of
-            # an undiscovered opening.
-            completed_3bv = len({c for c in where_coords(self.grid >= 0)
-                if c not in rem_opening_coords})
-            return lost_mf.get_3bv() - completed_3bv
-    def get_prop_complete(self):
-        """Calculate the progress of solving the board using 3bv."""
-        return float(self.mf.bbbv - self.get_rem_3bv())/self.mf.bbbv
-    def get_3bvps(self):
-        """Return the 3bv/s."""
-        if self.start_time:
-            return (self.mf.bbbv *
-                self.get_prop_complete() / self.get_time_passed())
-
+def update_info():
+    """Ensure the info.json file contains the version, only writing to it if
+    it has changed."""
+    info = {'version': __version__, 'frozen': IN_EXE}
+    path = join(file_direc, 'info.json')
+    try:
+        with open(path, 'r') as f:
+            if json.load(f) == info:
+                return
+    except (OSError, ValueError):
+        pass # Missing or corrupt - rewrite it
+    with open(path, 'w') as f:
+        json.dump(info, f)
 
 def run():
-    # Ensure info.json file contains the version
-    with open(join(file_direc, 'info.json'), 'w') as f:
-        json.dump({'version': __version__, 'frozen': IN_EXE}, f)
+    update_info()
     # Import settings
     try:
         with open(join(file_direc, 'settings.cfg'), 'r') as f:
@@ -290,7 +237,17 @@ def run():
     for attr in default_settings:
         if attr not in settings:
             settings[attr] = default_settings[attr]
-    p = Processor(**settings)
+    # Determine which UI to use
+    if '--cli' in sys.argv:
+        sys.argv.remove('--cli')
+        ui = 'cli'
+    else:
+        ui = 'gui'
+    # Exit once the UI has been created, used for timing the startup
+    start = '--startup-only' not in sys.argv
+    if not start:
+        sys.argv.remove('--startup-only')
+    p = Processor(ui, start, **settings)
 
 
 if __name__ == '__main__':
@@ -2,19 +2,204 @@
 
 import random as rnd
 import logging
+import json
+from math import lgamma, log, exp
+from bisect import bisect_right
+from functools import lru_cache
+from itertools import accumulate
 
-from utils import prettify_grid, get_nbrs
+from utils import prettify_grid, get_nbr_table, has_numpy
+
+
+# Imported by load_numpy when the array code is first used.
+np = None
+
+def load_numpy():
+    """Import numpy for the array code in this module, and return it."""
+    global np
+    if np is None:
+        import numpy as np
+    return np
+
+def pad_board(arr, fill=0):
+    """Pad the last two axes of the array with a border of width one (faster
+    than numpy.pad for this simple case)."""
+    shape = arr.shape[:-2] + (arr.shape[-2] + 2, arr.shape[-1] + 2)
+    p = np.full(shape, fill, dtype=arr.dtype)
+    p[..., 1:-1, 1:-1] = arr
+    return p
+
+def nbr_sums(arr):
+    """Sum each cell's 3x3 neighbourhood (including the cell itself) over the
+    last two axes of the array, so that a stack of boards can be passed in."""
+    p = pad_board(arr)
+    # The 3x3 window is separable - sum along rows then along columns.
+    rows = p[..., :-2] + p[..., 1:-1] + p[..., 2:]
+    return rows[..., :-2, :] + rows[..., 1:-1, :] + rows[..., 2:, :]
+
+def label_openings(zeros):
+    """Label the 8-connected regions of True cells in the boolean array zeros
+    over the last two axes, so that a stack of boards can be passed in. Return
+    an int array with -1 for cells not in a region and the region number
+    otherwise, and the number of regions in each board. Regions are numbered
+    separately in each board, in order of their first cell."""
+    size = zeros.size
+    X = zeros.shape[-1]
+    cell_index = np.arange(size).reshape(zeros.shape)
+    # Find the pairs of adjacent True cells, considering the neighbours to the
+    #  right, below, below-right and below-left of each cell.
+    a, b = [], []
+    for (z1, z2, idx, offset) in [
+            (zeros[..., :, :-1], zeros[..., :, 1:], cell_index[..., :, :-1], 1),
+            (zeros[..., :-1, :], zeros[..., 1:, :], cell_index[..., :-1, :], X),
+            (zeros[..., :-1, :-1], zeros[..., 1:, 1:],
+             cell_index[..., :-1, :-1], X + 1),
+            (zeros[..., :-1, 1:], zeros[..., 1:, :-1],
+             cell_index[..., :-1, 1:], X - 1)]:
+        cells = idx[z1 & z2]
+        a.append(cells)
+        b.append(cells + offset)
+    a, b = np.concatenate(a), np.concatenate(b)
+    # Each cell points to a cell in the same region with lower index - join
+    #  regions by pointing the higher root at the lower one, then shortcut the
+    #  pointers until every cell points straight at the root of its region.
+    root = np.arange(size)
+    true_cells = cell_index[zeros]
+    while len(a) > 0:
+        ra, rb = root[a], root[b]
+        unjoined = ra != rb
+        a, b, ra, rb = a[unjoined], b[unjoined], ra[unjoined], rb[unjoined]
+        np.minimum.at(root, np.maximum(ra, rb), np.minimum(ra, rb))
+        while True:
+            nxt = root[root[true_cells]]
+            if np.array_equal(nxt, root[true_cells]):
+                break
+            root[true_cells] = nxt
+    is_root = zeros.ravel() & (root == cell_index.ravel())
+    board_roots = is_root.reshape(-1, zeros.shape[-2] * X)
+    region_nums = np.where(is_root,
+                           (np.cumsum(board_roots, axis=1) - 1).ravel(), -1)
+    labels = region_nums[root].reshape(zeros.shape)
+    return labels, board_roots.sum(axis=1).reshape(zeros.shape[:-2])
+
+# When placing several mines per cell, mines are dropped one at a time into
+#  cells chosen uniformly at random, and only the ways of doing so respecting
+#  the maximum per cell are allowed (all equally likely). So an arrangement
+#  with c_i mines in cell i has weight prod(1/c_i!), as in the solver. The
+#  mines are placed by first choosing how many cells contain each number of
+#  mines (the "profile"), then choosing the cells.
+
+@lru_cache(maxsize=2**16)
+def log_profile_weight(j, cells, mines):
+    """Log of the total weight of the profiles of mines in cells with at most
+    j per cell, where a profile with k_i cells containing i mines has weight
+    prod(1/(k_i! * i!^k_i)) (so the number of ways to place the labelled
+    mines is cells! * mines! times this)."""
+    if j == 1:
+        return -lgamma(mines + 1) - lgamma(cells - mines + 1)
+    top, ks, weights = get_profile_weights(j, cells, mines)
+    return top + log(sum(weights))
+
+# Weights below this fraction of the largest are left out.
+min_weight = exp(-40)
+
+def get_profile_weights(j, cells, mines):
+    """Get the weights of the profiles in log_profile_weight by the number k of
+    cells containing j mines. Return the log of the largest weight, the
+    numbers (in no particular order) and their weights relative to the
+    largest. Numbers with negligible weight are left out, which keeps this
+    fast for huge boards."""
+    def f(k):
+        return (-lgamma(k + 1) - k*lgamma(j + 1)
+                + log_profile_weight(j - 1, cells - k, mines - j*k))
+    if j == 2:
+        # The ratio of consecutive weights is simple to calculate, which is
+        #  much faster than lgamma when many of these are needed (for 3 or
+        #  more mines per cell on huge boards).
+        def ratio(k):
+            return ((mines - 2*k) * (mines - 2*k - 1)
+                    / (2 * (k + 1) * (cells - mines + k + 1)))
+    else:
+        def ratio(k):
+            return exp(f(k + 1) - f(k))
+    # The other cells must be able to hold the rest of the mines.
+    lo, hi = max(0, mines - (j - 1)*cells), min(cells, mines // j)
+    # The weights rise to a single peak - find it, then go out either side
+    #  until the weights are negligible.
+    a, b = lo, hi
+    while a < b:
+        mid = (a + b) // 2
+        if ratio(mid) > 1:
+            a = mid + 1
+        else:
+            b = mid
+    ks, weights = [a], [1.0]
+    w = 1.0
+    for k in range(a, hi):
+        w *= ratio(k)
+        if w < min_weight:
+            break
+        ks.append(k + 1)
+        weights.append(w)
+    w = 1.0
+    for k in range(a - 1, lo - 1, -1):
+        w /= ratio(k)
+        if w < min_weight:
+            break
+        ks.append(k)
+        weights.append(w)
+    return f(a), ks, weights
+
+@lru_cache(maxsize=2**14)
+def get_profile_dist(j, cells, mines):
+    """Get the distribution of the number of cells containing j mines, for the
+    profiles in log_profile_weight. Return the possible numbers and their
+    cumulative weights."""
+    top, ks, weights = get_profile_weights(j, cells, mines)
+    order = sorted(range(len(ks)), key=ks.__getitem__)
+    return [ks[i] for i in order], list(accumulate(weights[i] for i in order))
+
+def get_mine_counts(nr_cells, nr_mines, per_cell, rng):
+    """Randomly choose the numbers of mines in the cells containing mines,
+    when nr_mines mines are placed in nr_cells cells with at most per_cell per
+    cell (see above). Return the numbers in decreasing order - the cells
+    containing them should be chosen uniformly at random. The argument rng is
+    only used for its random method, and isn't used if there's only one
+    possibility (e.g. if per_cell is 1)."""
+    counts = []
+    cells, mines = nr_cells, nr_mines
+    for j in range(min(per_cell, nr_mines), 1, -1):
+        ks, cum = get_profile_dist(j, cells, mines)
+        if len(ks) == 1:
+            k = ks[0]
+        else:
+            k = ks[bisect_right(cum, rng.random() * cum[-1])]
+        counts += k*[j]
+        cells -= k
+        mines -= j*k
+    return counts + mines*[1]
 
 
 class Minefield(list):
+    # Whether to use the numpy-backed implementations of the methods deriving
+    #  the completed board, openings and 3bv. These are much faster on larger
+    #  boards but slower on small ones, so they're only used for boards with
+    #  at least min_array_cells cells (about expert size).
+    use_arrays = has_numpy
+    min_array_cells = 400
     def __init__(self, x_size, y_size):
         super().__init__()
+        self.use_arrays = (self.use_arrays
+                           and x_size*y_size >= self.min_array_cells)
+        if self.use_arrays:
+            load_numpy()
         for j in range(y_size):
             row = x_size*[0]
             self.append(row)
         self.x_size, self.y_size = x_size, y_size
         self.all_coords = [(x, y) for x in range(x_size) for y in range(y_size)]
         self.nr_mines = 0
+        self.per_cell = 1
         self.mine_coords = []
         self.completed_board = []
         for j in range(y_size):
@@ -32,13 +217,21 @@ class Minefield(list):
         self.nr_mines = len(self.mine_coords)
         for (x, y) in coords:
             self[y][x] += 1
-    def create(self, nr_mines, per_cell=1, safe_coords=[]):
+    def create(self, nr_mines, per_cell=1, safe_coords=[], rng=None):
+        """Randomly place the mines, avoiding safe_coords if possible. The
+        argument rng can be a random.Random instance or a seed to create one
+        with, otherwise the global random state is used."""
         assert self.mine_coords == [], "Minefield already created."
+        if rng is None:
+            rng = rnd
+        elif not isinstance(rng, rnd.Random):
+            rng = rnd.Random(rng)
         self.nr_mines = nr_mines
         self.per_cell = per_cell
         assert (nr_mines < (self.x_size*self.y_size - 1) * per_cell), (
             "Too many mines ({}) for grid with dimensions {} x {}.".format(
                 nr_mines, self.x_size, self.y_size))
+        safe_coords = set(safe_coords)
         avble_coords = [c for c in self.all_coords if c not in safe_coords]
         # Can't give opening on first click if too many mines.
         if nr_mines > len(avble_coords) * per_cell:
@@ -47,61 +240,152 @@ class Minefield(list):
                 "too many mines ({} mines, {} cells, {} safe_coords).".format(
                     nr_mines, self.x_size*self.y_size, len(safe_coords)))
             avble_coords = self.all_coords[:]
-        if per_cell == 1:
-            rnd.shuffle(avble_coords)
-            self.create_from_list(avble_coords[:nr_mines])
-        else:
-            n = 0
-            while n < nr_mines:
-                pos = rnd.randint(0, self.x_size*self.y_size - 1)
-                x, y = pos % self.x_size, pos // self.x_size
-                if (x, y) not in safe_coords and self[y][x] < self.per_cell:
-                    self[y][x] += 1
-                    self.mine_coords.append((x, y))
-                    n += 1
-            self.mine_coords.sort()
+        # Choose the numbers of mines in the cells containing mines, then the
+        #  cells to put them in.
+        counts = get_mine_counts(len(avble_coords), nr_mines, per_cell, rng)
+        cells = rng.sample(range(len(avble_coords)), len(counts))
+        coords = [avble_coords[c] for c, n in zip(cells, counts)
+                  for i in range(n)]
+        if per_cell > 1:
+            coords.sort()
+        self.create_from_list(coords)
         # print(prettify_grid(self))
         self.get_completed_board()
         self.get_3bv()
     def get_completed_board(self):
+        if self.use_arrays:
+            self.get_completed_array()
+            return
+        nbr_table = get_nbr_table(self.x_size, self.y_size)
         for (x, y) in self.all_coords:
             mines = self[y][x]
             if mines > 0:
-                # print((x, y))
                 self.completed_board[y][x] = 'F' + str(mines)
-                # print(prettify_grid(self.completed_board))
-                for (i, j) in get_nbrs(x, y, self.x_size, self.y_size):
-                    # print("  ", (i, j), self[j][i])
+                for (i, j) in nbr_table[y*self.x_size + x]:
                     if self[j][i] == 0:
                         self.completed_board[j][i] += mines
+    def get_completed_array(self):
+        """Array-backed equivalent of get_completed_board, also storing the
+        arrays self.mines_array and self.completed_array (with mines counted
+        in the latter as -1)."""
+        self.mines_array = np.array(self, dtype=np.int8)
+        is_mine = self.mines_array > 0
+        self.completed_array = np.where(is_mine, -1,
+                                        nbr_sums(self.mines_array))
+        self.completed_board = self.completed_array.tolist()
+        for y, x in zip(*np.nonzero(is_mine)):
+            self.completed_board[y][x] = 'F' + str(self[y][x])
     def get_openings(self):
-        self.openings = []
-        all_found = set()
+        """Find the openings, storing them in self.openings as sorted lists of
+        the coordinates they reveal. Also store:
+         - self.opening_ids, a grid giving the index of the opening containing
+           each zero cell (-1 for other cells);
+         - self.opening_cells, a flat list of the coordinates of every opening
+           in turn, with opening i spanning the slice between indices
+           self.opening_starts[i] and self.opening_starts[i+1];
+         - self.opening_edge_cells and self.opening_edge_starts, storing the
+           boundary (non-zero) cells of each opening in the same way."""
+        if self.use_arrays:
+            self.get_opening_labels()
+            return
+        nbr_table = get_nbr_table(self.x_size, self.y_size)
+        self.opening_ids = [self.x_size*[-1] for j in range(self.y_size)]
+        openings = []
         for (x, y) in self.all_coords:
-            coord = (x, y)
-            if self.completed_board[y][x] == 0 and coord not in all_found:
-                opening = set([coord])
-                check = set([coord])
+            if self.completed_board[y][x] == 0 and self.opening_ids[y][x] < 0:
+                opening_id = len(openings)
+                self.opening_ids[y][x] = opening_id
+                opening = {(x, y)}
+                check = [(x, y)]
                 while check:
                     c = check.pop()
-                    nbrs = set(get_nbrs(c[0], c[1], self.x_size, self.y_size))
-                    check |= {(i, j) for (i, j) in nbrs - opening
-                               if self.completed_board[j][i] == 0}
-                    opening |= nbrs
-                self.openings.append(sorted(opening))
-                all_found |= opening
-    def get_3bv(self):        #[Move to C?]
+                    for (i, j) in nbr_table[c[1]*self.x_size + c[0]]:
+                        opening.add((i, j))
+                        if (self.completed_board[j][i] == 0
+                            and self.opening_ids[j][i] < 0):
+                            self.opening_ids[j][i] = opening_id
+                            check.append((i, j))
+                openings.append(sorted(opening))
+        self.openings = openings
+        self.opening_cells, self.opening_starts = [], [0]
+        self.opening_edge_cells, self.opening_edge_starts = [], [0]
+        for opening in openings:
+            self.opening_cells.extend(opening)
+            self.opening_edge_cells.extend([(x, y) for (x, y) in opening
+                                            if self.completed_board[y][x] != 0])
+            self.opening_starts.append(len(self.opening_cells))
+            self.opening_edge_starts.append(len(self.opening_edge_cells))
+    def get_opening_labels(self):
+        """Array-backed equivalent of get_openings, also storing the array of
+        labels of the zero cells in self.opening_labels (-1 elsewhere)."""
+        if not hasattr(self, 'completed_array'):
+            self.get_completed_array()
+        X, Y = self.x_size, self.y_size
+        # Label the transpose to number the openings in (x, y) order.
+        labels, nr_openings = label_openings((self.completed_array == 0).T)
+        self.opening_labels = labels = labels.T
+        self.opening_ids = labels.tolist()
+        opening_range = np.arange(int(nr_openings) + 1)
+        # Each opening consists of its zero cells and their neighbours - find
+        #  the (opening, cell) pairs by shifting the labels over each cell.
+        padded = pad_board(labels, -1)
+        cell_index = np.arange(X * Y).reshape(Y, X)
+        pairs = []
+        for dy in range(3):
+            for dx in range(3):
+                shifted = padded[dy:dy+Y, dx:dx+X]
+                in_opening = shifted >= 0
+                # Sort within each opening by (x, y) coordinate.
+                pairs.append(shifted[in_opening] * X * Y
+                             + (cell_index[in_opening] % X) * Y
+                             + cell_index[in_opening] // X)
+        pairs = np.unique(np.concatenate(pairs))
+        opening_nums = pairs // (X * Y)
+        xs = (pairs % (X * Y)) // Y
+        ys = pairs % Y
+        self.opening_cells = list(zip(xs.tolist(), ys.tolist()))
+        self.opening_starts = np.searchsorted(opening_nums,
+                                              opening_range).tolist()
+        is_edge = self.completed_array[ys, xs] != 0
+        self.opening_edge_cells = list(zip(xs[is_edge].tolist(),
+                                           ys[is_edge].tolist()))
+        self.opening_edge_starts = np.searchsorted(opening_nums[is_edge],
+                                                   opening_range).tolist()
+        starts = self.opening_starts
+        self.openings = [self.opening_cells[starts[i]:starts[i+1]]
+                         for i in range(len(starts) - 1)]
+    def get_mines(self, x, y):
+        """Get the number of mines in the cell at (x, y)."""
+        return self[y][x]
+    def get_mine_cells(self):
+        """Get the set of coordinates of the cells containing mines."""
+        return set(self.mine_coords)
+    def get_completed_cell(self, x, y):
+        return self.completed_board[y][x]
+    def get_opening(self, x, y):
+        """Get the coordinates revealed by clicking the zero cell at (x, y)."""
+        i = self.opening_ids[y][x]
+        return self.opening_cells[self.opening_starts[i]:
+                                  self.opening_starts[i+1]]
+    def get_3bv(self):
         if hasattr(self, 'bbbv'):
             return self.bbbv
+        if self.use_arrays:
+            self.get_opening_labels()
+            zeros = self.completed_array == 0
+            exposed = nbr_sums(zeros.astype(np.int8)) > 0
+            unexposed = (self.completed_array > 0) & ~exposed
+            self.bbbv = len(self.openings) + int(unexposed.sum())
+            return self.bbbv
         self.get_openings()
         clicks = len(self.openings)
         exposed = len({c for opening in self.openings for c in opening})
         clicks += self.x_size*self.y_size - len(set(self.mine_coords)) - exposed
         self.bbbv = clicks
+        return self.bbbv
 
     def serialise(self, path):
-        assert mine_coords is not None, (
-            "Minefield not initialised - nothing to save.")
+        assert self.mine_coords, "Minefield not initialised - nothing to save."
         # No need to be secure.
         obj = dict()
         for attr in ['mine_coords', 'x_size', 'y_size', 'per_cell']:
@@ -114,13 +398,169 @@ class Minefield(list):
             obj = json.load(f)
         mf = cls(obj['x_size'], obj['y_size'])
         # json stores tuples as lists - convert back.
-        mine_coords = map(tuple, obj['mine_coords'])
+        mine_coords = list(map(tuple, obj['mine_coords']))
         mf.create_from_list(mine_coords)
         mf.per_cell = obj['per_cell']
+        mf.get_completed_board()
+        mf.get_3bv()
         return mf
 
 
 
+class MinefieldBatch:
+    """Many minefields of the same settings, stored as stacked arrays (with the
+    board index as the first axis) for bulk generation. Requires numpy."""
+    def __init__(self, nr_boards, x_size, y_size):
+        assert has_numpy, "Batches of minefields require numpy."
+        load_numpy()
+        self.nr_boards = nr_boards
+        self.x_size, self.y_size = x_size, y_size
+        self.nr_mines = 0
+        self.mines = np.zeros((nr_boards, y_size, x_size), dtype=np.int8)
+    def __repr__(self):
+        mines = " with {} mines".format(self.nr_mines) if self.nr_mines else ""
+        return "<batch of {} {}x{} minefields{}>".format(
+            self.nr_boards, self.x_size, self.y_size, mines)
+    def __len__(self):
+        return self.nr_boards
+    def __getitem__(self, index):
+        """Get a single board as a Minefield object (see also select)."""
+        mf = Minefield(self.x_size, self.y_size)
+        ys, xs = np.nonzero(self.mines[index])
+        coords = []
+        for x, y in zip(xs.tolist(), ys.tolist()):
+            coords += self.mines[index, y, x] * [(x, y)]
+        mf.create_from_list(sorted(coords))
+        mf.per_cell = self.per_cell
+        mf.get_completed_board()
+        mf.get_3bv()
+        return mf
+    def create(self, nr_mines, per_cell=1, safe_coords=[], rng=None):
+        """Randomly place the mines in every board, with the same options as
+        Minefield.create. The argument rng can be anything accepted by
+        numpy.random.default_rng, e.g. a seed."""
+        assert self.nr_mines == 0, "Minefields already created."
+        self.nr_mines = nr_mines
+        self.per_cell = per_cell
+        X, Y = self.x_size, self.y_size
+        assert (nr_mines < (X*Y - 1) * per_cell), (
+            "Too many mines ({}) for grid with dimensions {} x {}.".format(
+                nr_mines, X, Y))
+        safe_cells = {y*X + x for (x, y) in safe_coords}
+        avble_cells = np.array([c for c in range(X*Y) if c not in safe_cells])
+        if nr_mines > len(avble_cells) * per_cell:
+            logging.warning(
+                "Unable to create minefields with requested safe_coords - "
+                "too many mines ({} mines, {} cells, {} safe_coords).".format(
+                    nr_mines, X*Y, len(safe_coords)))
+            avble_cells = np.arange(X*Y)
+        rng = np.random.default_rng(rng)
+        offsets = X*Y * np.arange(self.nr_boards)[:, None]
+        if nr_mines > 0 and per_cell == 1:
+            # Choose the cells with the smallest random keys.
+            keys = rng.random((self.nr_boards, len(avble_cells)),
+                              dtype=np.float32)
+            slots = np.argpartition(keys, nr_mines - 1, axis=1)[:, :nr_mines]
+            cells = avble_cells[slots] + offsets
+            counts = np.bincount(cells.ravel(), minlength=self.nr_boards*X*Y)
+            self.mines = counts.astype(np.int8).reshape(self.mines.shape)
+        elif nr_mines > 0:
+            # Choose the numbers of mines in each board as in Minefield.create,
+            #  then put them in the cells in a random order.
+            counts = np.zeros((self.nr_boards, len(avble_cells)), np.int8)
+            for b in range(self.nr_boards):
+                board_counts = get_mine_counts(len(avble_cells), nr_mines,
+                                               per_cell, rng)
+                counts[b, :len(board_counts)] = board_counts
+            keys = rng.random(counts.shape, dtype=np.float32)
+            cells = avble_cells[np.argsort(keys, axis=1)] + offsets
+            mines = np.bincount(cells.ravel(), weights=counts.ravel(),
+                                minlength=self.nr_boards*X*Y)
+            self.mines = mines.astype(np.int8).reshape(self.mines.shape)
+        self.get_completed_boards()
+        self.get_3bv()
+    def select(self, index):
+        """Get a new batch containing the boards selected by indexing the
+        stacked arrays with index (e.g. a slice)."""
+        batch = MinefieldBatch(0, self.x_size, self.y_size)
+        batch.nr_mines, batch.per_cell = self.nr_mines, self.per_cell
+        for attr in ['mines', 'completed', 'opening_labels', 'nr_openings',
+                     'bbbv']:
+            if hasattr(self, attr):
+                setattr(batch, attr, getattr(self, attr)[index])
+        batch.nr_boards = len(batch.mines)
+        return batch
+    @classmethod
+    def join(cls, batches):
+        """Join batches of boards with the same settings into one batch."""
+        batch = batches[0].select(slice(None))
+        for attr in ['mines', 'completed', 'opening_labels', 'nr_openings',
+                     'bbbv']:
+            if hasattr(batch, attr):
+                setattr(batch, attr, np.concatenate([getattr(b, attr)
+                                                     for b in batches]))
+        batch.nr_boards = len(batch.mines)
+        return batch
+    def get_completed_boards(self):
+        """Store the completed boards in self.completed, with mines counted as
+        -1 and other cells containing the number of neighbouring mines."""
+        self.completed = np.where(self.mines > 0, -1, nbr_sums(self.mines))
+    def get_3bv(self):
+        """Label the openings in each board (in the same order as the
+        Minefield class) and store the 3bv of each board in self.bbbv."""
+        zeros = self.completed == 0
+        labels, self.nr_openings = label_openings(zeros.swapaxes(-1, -2))
+        self.opening_labels = labels.swapaxes(-1, -2)
+        exposed = nbr_sums(zeros.astype(np.int8)) > 0
+        unexposed = (self.completed > 0) & ~exposed
+        self.bbbv = self.nr_openings + unexposed.sum(axis=(-2, -1))
+        return self.bbbv
+
+
+# Number of consecutive boards generated from each PRNG stream by
+#  generate_minefields - changing this changes the boards for every seed.
+SEED_CHUNK_SIZE = 256
+
+def create_seeded_chunk(seed, chunk, x_size, y_size, nr_mines, per_cell=1,
+                        safe_coords=[]):
+    """Create the chunk of boards with the given index for the given seed,
+    returning a MinefieldBatch of SEED_CHUNK_SIZE boards."""
+    batch = MinefieldBatch(SEED_CHUNK_SIZE, x_size, y_size)
+    batch.create(nr_mines, per_cell, safe_coords,
+                 rng=np.random.default_rng([seed, chunk]))
+    return batch
+
+def generate_minefields(seed, nr_boards, x_size, y_size, nr_mines, per_cell=1,
+                        safe_coords=[], start=0, workers=1):
+    """Generate the boards with indices start to start+nr_boards-1 for the
+    given (non-negative integer) seed, returning a MinefieldBatch. Each board
+    depends only on the seed and its index, so any board can be regenerated
+    from the (seed, index) pair and the result doesn't depend on the number of
+    worker processes used to spread the work."""
+    if nr_boards < 0:
+        raise ValueError("Invalid number of boards, {}.".format(nr_boards))
+    elif nr_boards == 0:
+        batch = MinefieldBatch(0, x_size, y_size)
+        batch.create(nr_mines, per_cell, safe_coords)
+        return batch
+    first_chunk = start // SEED_CHUNK_SIZE
+    last_chunk = (start + nr_boards - 1) // SEED_CHUNK_SIZE
+    chunks = range(first_chunk, last_chunk + 1)
+    args = [(seed, c, x_size, y_size, nr_mines, per_cell, safe_coords)
+            for c in chunks]
+    if workers > 1 and len(chunks) > 1:
+        # Imported here as it's slow to import and rarely needed.
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(workers) as executor:
+            batches = list(executor.map(create_seeded_chunk, *zip(*args)))
+    else:
+        batches = [create_seeded_chunk(*a) for a in args]
+    offset = start - first_chunk * SEED_CHUNK_SIZE
+    return MinefieldBatch.join(batches).select(
+        slice(offset, offset + nr_boards))
+
+
+
 
 
 if __name__ == '__main__':
@@ -0,0 +1,15 @@
+"""
+Solver for finding the probability of each cell containing a mine.
+
+The modules in this package import each other (and the modules in src)
+directly, as when run as scripts, so this directory is added to the path when
+the package is imported.
+"""
+
+import sys
+from os.path import dirname, abspath
+
+
+solver_direc = dirname(abspath(__file__))
+if solver_direc not in sys.path:
+    sys.path.append(solver_direc)
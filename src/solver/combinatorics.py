@@ -0,0 +1,137 @@
+"""
+Combinatorics in log space for the solver, shared by probabilities.py and
+gen_probs. The numbers of ways to arrange the mines on a board are far too big
+for floats (and slow to calculate exactly), so their logs are used instead,
+with the log factorials looked up in a table. The table is extended to the
+size of each board before it is solved, so the weight of a configuration is
+found with a few additions.
+
+When cells can contain more than one mine, the numbers of ways to put m mines
+in s cells are found for all m at once by adding one cell at a time (dynamic
+programming on the generating function), giving a row of log counts for each
+s. Rows are kept in a least-recently-used cache, along with rows at regular
+intervals of s to start later calculations from. They can also be kept in a
+JSON file in the files directory with enable_disk_cache.
+"""
+
+import json
+from math import lgamma, log, exp, inf
+from os.path import join
+from collections import OrderedDict
+
+from utils import file_direc, load_json_cache
+
+
+# Table of log(n!), indexed by n
+log_facs = [0.0]
+
+def extend_log_facs(n):
+    """Extend the table of log factorials up to log(n!)."""
+    for i in range(len(log_facs), n + 1):
+        log_facs.append(lgamma(i + 1))
+
+def log_fac(n):
+    if n >= len(log_facs):
+        extend_log_facs(n)
+    return log_facs[n]
+
+def log_perms(s, m):
+    """Log of s!/(s - m)!, the number of ways to put m labelled mines in
+    different cells out of s, or -inf if m > s."""
+    if m > s:
+        return -inf
+    return log_fac(s) - log_fac(s - m)
+
+def log_combs(s, m, xmax=1):
+    """Log of the number of ways to put m labelled mines in s cells with at
+    most xmax per cell (see gen_probs.combs), or -inf if there are none."""
+    if m > s*xmax:
+        return -inf
+    elif m == 0:
+        return 0.0
+    elif xmax == 1:
+        return log_perms(s, m)
+    elif xmax >= m:
+        return m * log(s)
+    elif s == 1:
+        return 0.0
+    else:
+        return log_fac(m) + get_combs_row(s, m, xmax)[m]
+
+def prob(s, m, xmax=1):
+    """Get the probability that a cell contains a mine, in a group of s cells
+    containing m mines with at most xmax per cell (as gen_probs.prob)."""
+    if m > s*xmax:
+        return 0
+    elif xmax == 1:
+        return m / s
+    elif xmax >= m:
+        return 1 - (1 - 1/s)**m
+    elif m > xmax*(s - 1):
+        return 1
+    else:
+        return 1 - exp(log_combs(s - 1, m, xmax) - log_combs(s, m, xmax))
+
+
+# Rows of log counts by (s, xmax) - see get_combs_row.
+combs_rows = OrderedDict()
+max_cached_rows = 256
+# Rows are also kept for every multiple of this number of cells, so that a new
+#  row only needs a few cells adding to one of these.
+row_interval = 16
+# Path of the JSON file the rows are saved in, if enabled.
+cache_path = None
+
+def enable_disk_cache(path=join(file_direc, 'combs_cache.json')):
+    """Load the cached rows from the given file, and save new rows to it."""
+    global cache_path
+    cache_path = path
+    for key, row in (load_json_cache(cache_path) or {}).items():
+        s, xmax = map(int, key.split(','))
+        combs_rows[(s, xmax)] = [-inf if x is None else x for x in row]
+
+def save_cache():
+    rows = {'{},{}'.format(s, xmax): [None if x == -inf else x for x in row]
+            for (s, xmax), row in combs_rows.items()}
+    with open(cache_path, 'w') as f:
+        json.dump(rows, f)
+
+def cache_row(s, xmax, row):
+    if len(combs_rows.get((s, xmax), [])) <= len(row):
+        combs_rows[(s, xmax)] = row
+    combs_rows.move_to_end((s, xmax))
+    while len(combs_rows) > max_cached_rows:
+        combs_rows.popitem(last=False)
+
+def get_combs_row(s, m_max, xmax):
+    """Get a list of log(c_m/m!) for m from 0 to at least m_max, where c_m is
+    the number of ways to put m labelled mines in s cells with at most xmax
+    per cell, i.e. the log coefficients of (1 + x + x^2/2! + ... +
+    x^xmax/xmax!)^s."""
+    row = combs_rows.get((s, xmax))
+    if row is not None and len(row) > m_max:
+        combs_rows.move_to_end((s, xmax))
+        return row
+    # Start from the cached row with the most cells up to s (long enough).
+    start, row = 0, [0.0] + [-inf] * m_max
+    for (s1, x1), row1 in combs_rows.items():
+        if x1 == xmax and start < s1 <= s and len(row1) > m_max:
+            start, row = s1, row1[:m_max + 1]
+    log_inv_facs = [-log_fac(j) for j in range(xmax + 1)]
+    for s1 in range(start + 1, s + 1):
+        # Add a cell containing j mines (with weight 1/j!) to each row entry
+        new_row = []
+        for m in range(m_max + 1):
+            terms = [row[m - j] + log_inv_facs[j]
+                     for j in range(min(m, xmax) + 1)]
+            top = max(terms)
+            if top == -inf:
+                new_row.append(-inf)
+            else:
+                new_row.append(top + log(sum(exp(t - top) for t in terms)))
+        row = new_row
+        if s1 % row_interval == 0 or s1 == s:
+            cache_row(s1, xmax, row)
+    if cache_path is not None:
+        save_cache()
+    return row
@@ -0,0 +1,152 @@
+"""
+Deductions about the number of mines in groups of cells which follow from the
+displayed numbers alone, without enumerating configurations.
+
+Each constraint says that the total number of mines in a set of groups has a
+given value, with the set of groups stored as a bitset (an int with bit i set
+for group i). The following rules are used until nothing more can be found:
+ - a constraint with value 0, or with the most mines its groups can hold,
+   fixes the number of mines in all of its groups;
+ - a constraint on a subset of another constraint's groups gives a constraint
+   on the rest of the other constraint's groups;
+ - integer Gaussian elimination combines the constraints, and any combination
+   whose value can only be reached one way fixes the groups in it.
+Each group found is substituted into the constraints before carrying on.
+"""
+
+from math import gcd
+from functools import reduce
+
+
+def get_bits(mask):
+    """Get the indices of the bits set in an int, lowest first."""
+    bits = []
+    while mask:
+        low = mask & -mask
+        bits.append(low.bit_length() - 1)
+        mask ^= low
+    return bits
+
+def deduce(constraints, bounds):
+    """Find the groups whose number of mines is certain, given constraints as
+    (bitset of groups, total mines) and the most mines each group can hold.
+    Return a dictionary of the number of mines in each group found. Raise
+    ValueError if the constraints can't all be satisfied."""
+    fixed = dict()
+    constraints = set(constraints)
+    while constraints:
+        found = apply_subset_rules(constraints, bounds)
+        if not found:
+            found = apply_elimination(constraints, bounds)
+        if not found:
+            break
+        fixed.update(found)
+        constraints = substitute(constraints, found)
+    return fixed
+
+def substitute(constraints, found):
+    """Take the groups found out of the constraints, returning a new set."""
+    found_mask = sum(1 << i for i in found)
+    new_constraints = set()
+    for mask, value in constraints:
+        if mask & found_mask:
+            for i in get_bits(mask & found_mask):
+                value -= found[i]
+            mask &= ~found_mask
+            if not mask:
+                if value != 0:
+                    raise ValueError("The constraints can't all be satisfied")
+                continue
+        new_constraints.add((mask, value))
+    return new_constraints
+
+def apply_simple_rule(constraints, bounds):
+    """Use the first rule on the given constraints, returning a dictionary of
+    the groups found."""
+    found = dict()
+    for mask, value in constraints:
+        bits = get_bits(mask)
+        space = sum([bounds[i] for i in bits])
+        if value < 0 or value > space:
+            raise ValueError("The constraints can't all be satisfied")
+        if value == 0 or value == space:
+            for i in bits:
+                m = 0 if value == 0 else bounds[i]
+                if found.setdefault(i, m) != m:
+                    raise ValueError("The constraints can't all be satisfied")
+    return found
+
+def apply_subset_rules(constraints, bounds):
+    """Use the first two rules, adding any constraints found with the subset
+    rule to the set. Return a dictionary of the groups found, stopping once
+    any are found."""
+    new = list(constraints)
+    while new:
+        found = apply_simple_rule(new, bounds)
+        if found:
+            return found
+        # Compare the new constraints with all of the others
+        derived = []
+        for mask, value in new:
+            for mask2, value2 in list(constraints):
+                common = mask & mask2
+                if common == mask and mask2 != mask:
+                    c = (mask2 ^ mask, value2 - value)
+                elif common == mask2 and mask2 != mask:
+                    c = (mask ^ mask2, value - value2)
+                else:
+                    continue
+                if c not in constraints:
+                    constraints.add(c)
+                    derived.append(c)
+        new = derived
+    return dict()
+
+def apply_elimination(constraints, bounds):
+    """Use the elimination rule, returning a dictionary of the groups
+    found."""
+    groups = get_bits(reduce(lambda a, b: a | b[0], constraints, 0))
+    columns = {i: col for col, i in enumerate(groups)}
+    rows = []
+    for mask, value in constraints:
+        row = [0] * (len(groups) + 1)
+        for i in get_bits(mask):
+            row[columns[i]] = 1
+        row[-1] = value
+        rows.append(row)
+    # Reduce the rows, keeping the entries as integers by scaling rows rather
+    #  than dividing, and then dividing each row by its common factor.
+    r = 0
+    for col in range(len(groups)):
+        pivot = next((k for k in range(r, len(rows)) if rows[k][col]), None)
+        if pivot is None:
+            continue
+        rows[r], rows[pivot] = rows[pivot], rows[r]
+        p = rows[r][col]
+        for k in range(len(rows)):
+            f = rows[k][col]
+            if k == r or f == 0:
+                continue
+            row = [p*a - f*b for a, b in zip(rows[k], rows[r])]
+            factor = reduce(gcd, row)
+            if factor > 1:
+                row = [a // factor for a in row]
+            rows[k] = row
+        r += 1
+    found = dict()
+    for row in rows:
+        value = row[-1]
+        lowest = sum(c * bounds[i] for c, i in zip(row, groups) if c < 0)
+        highest = sum(c * bounds[i] for c, i in zip(row, groups) if c > 0)
+        if value < lowest or value > highest:
+            raise ValueError("The constraints can't all be satisfied")
+        if value == lowest:
+            # Groups with negative coefficients are full, the others empty
+            for c, i in zip(row, groups):
+                if c:
+                    found[i] = bounds[i] if c < 0 else 0
+        elif value == highest:
+            for c, i in zip(row, groups):
+                if c:
+                    found[i] = bounds[i] if c > 0 else 0
+    return found
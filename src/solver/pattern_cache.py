@@ -0,0 +1,118 @@
+"""
+Cache of the weights of solved frontier components (see ProbsGrid), keyed by
+the pattern of numbers and unclicked cells making up the component.
+
+The same small patterns come up again and again, in different places and
+orientations, so patterns are put in a canonical form first - the smallest of
+the 8 rotations and reflections, each moved to the origin. The weights of the
+component's groups are stored in the order of the groups in the canonical
+pattern, so they can be mapped onto any matching component. The cache keeps
+the most recently used patterns up to a maximum number, and can be saved to
+and loaded from a JSON file.
+"""
+
+import json
+from os.path import join
+from collections import OrderedDict
+
+from utils import file_direc, load_json_cache
+
+
+default_path = join(file_direc, 'pattern_cache.json')
+# The 8 rotations and reflections, as matrices (a, b, c, d) taking (x, y) to
+#  (a*x + b*y, c*x + d*y).
+transforms = [
+    ( 1,  0,  0,  1),
+    (-1,  0,  0,  1),
+    ( 1,  0,  0, -1),
+    (-1,  0,  0, -1),
+    ( 0,  1,  1,  0),
+    ( 0, -1,  1,  0),
+    ( 0,  1, -1,  0),
+    ( 0, -1, -1,  0),
+    ]
+
+def get_canonical_pattern(groups, numbers, max_per_cell):
+    """Get the canonical form of the pattern of a component, given the lists
+    of coordinates of its groups and a dictionary of the values of its
+    numbers. Return the pattern and the order of the groups in it (as indices
+    into groups)."""
+    xs = [x for (x, y) in numbers]
+    ys = [y for (x, y) in numbers]
+    corners = [(x, y) for x in (min(xs), max(xs)) for y in (min(ys), max(ys))]
+    # Compare the numbers first, so the cells only need moving for the
+    #  transforms giving the smallest numbers (usually just one).
+    candidates = []
+    for (a, b, c, d) in transforms:
+        # Move the numbers to the origin
+        x0 = min(a*x + b*y for (x, y) in corners)
+        y0 = min(c*x + d*y for (x, y) in corners)
+        moved_nrs = sorted([((a*x + b*y - x0, c*x + d*y - y0), nr)
+                            for (x, y), nr in numbers.items()])
+        candidates.append((tuple(moved_nrs), (a, b, c, d, x0, y0)))
+    min_nrs = min(nrs for nrs, t in candidates)
+    best = None
+    for nrs, (a, b, c, d, x0, y0) in candidates:
+        if nrs != min_nrs:
+            continue
+        # The cells are moved along with the numbers
+        moved_groups = [[(a*x + b*y - x0, c*x + d*y - y0) for (x, y) in coords]
+                        for coords in groups]
+        cells = tuple(sorted([coord for coords in moved_groups
+                             for coord in coords]))
+        if best is None or cells < best[0]:
+            best = cells, moved_groups
+    cells, moved_groups = best
+    order = sorted(range(len(groups)), key=lambda i: min(moved_groups[i]))
+    return (max_per_cell, min_nrs, cells), order
+
+def to_tuple(obj):
+    """Convert nested lists (e.g. loaded from JSON) to nested tuples."""
+    if isinstance(obj, list):
+        return tuple(to_tuple(x) for x in obj)
+    return obj
+
+
+class PatternCache:
+    def __init__(self, max_size=2000):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+    def __repr__(self):
+        return "<PatternCache with {} patterns, {} hits, {} misses>".format(
+            len(self.entries), self.hits, self.misses)
+    def __len__(self):
+        return len(self.entries)
+    def get(self, pattern):
+        """Get the weights stored for a canonical pattern, or None if it isn't
+        in the cache."""
+        value = self.entries.get(pattern)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.entries.move_to_end(pattern)
+        return value
+    def add(self, pattern, value):
+        self.entries[pattern] = value
+        self.entries.move_to_end(pattern)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+    def get_hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0
+    def clear(self):
+        self.entries.clear()
+        self.hits = self.misses = 0
+    def save(self, path=default_path):
+        with open(path, 'w') as f:
+            json.dump(list(self.entries.items()), f)
+    def load(self, path=default_path):
+        """Add the patterns saved in the given file, if it exists."""
+        for pattern, (weights, group_weights) in load_json_cache(path) or []:
+            self.add(to_tuple(pattern), (weights, group_weights))
+
+
+# Cache shared by all solves unless another is given.
+pattern_cache = PatternCache()
@@ -1,70 +1,118 @@
 
 
-from math import log, exp, factorial as fac
-import time as tm
+from math import exp
+from itertools import islice
 
-from utils import prettify_grid, get_nbrs
-from gen_probs import prob as get_unsafe_prob, combs as get_combs
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from utils import prettify_grid, get_nbr_table, get_nbr_index_table
+from board import (Board, BoardView, UNCLICKED, NUMBER, FLAG, MINE, LIFE,
+                   COUNT_BITS, COUNT_MASK)
+try:
+    from gen_probs import prob as get_unsafe_prob
+except ImportError:
+    # The compiled module isn't available for this platform
+    from combinatorics import prob as get_unsafe_prob
+from combinatorics import extend_log_facs, log_fac, log_perms, log_combs
+from pattern_cache import get_canonical_pattern, pattern_cache
+from deduction import deduce
 
 
 class ProbsGrid(list):
-    def __init__(self, board, ignore_flags=False, **settings):
+    # Number of configurations taken at a time when summing their weights with
+    #  arrays.
+    config_block_size = 4096
+    # Smallest number of groups in a component for it to be looked up in the
+    #  pattern cache - smaller components are as quick to solve again.
+    min_cached_groups = 4
+    def __init__(self, board, ignore_flags=False, prev=None, changed=(),
+                 cache=pattern_cache, **settings):
+        """The board can be a Board (or a view of one), or a grid in the
+        string representation. If the grid for an earlier state of the same
+        game is given as prev, with the coordinates of the cells changed since
+        then, only the parts of the board affected by the changes are solved
+        again (see GameSolver). The weights of components are looked up in
+        and added to the given PatternCache, unless it is None."""
         super().__init__()
-        self.x_size, self.y_size = len(board[0]), len(board)
+        if not isinstance(board, BoardView):
+            board = Board.from_legacy(board)
+        self.x_size, self.y_size = board.x_size, board.y_size
         for j in range(self.y_size):
             row = self.x_size*[0]
             self.append(row)
         self.all_coords = [(x, y) for x in range(self.x_size)
                            for y in range(self.y_size)]
         if ignore_flags:
-            for (x, y) in self.all_coords:
-                if board[y][x][0] == 'F':
-                    board[y][x] = 'U'
+            board = board.copy()
+            for (x, y) in board.get_coords(FLAG):
+                board.set(x, y, UNCLICKED)
         self.board = board
         for attr in ['nr_mines', 'max_per_cell']:
             setattr(self, attr, settings[attr])
-        self.clickable_coords = [(x, y) for (x, y) in self.all_coords
-                                 if board[y][x]=='U']
-        self.found_mines = sum([int(c[1]) for row in self.board for c in row
-                                if str(c)[0] in ['F', 'L']])
-        self.get_displayed_numbers()
+        extend_log_facs(max(self.x_size*self.y_size, self.nr_mines))
+        self.clickable_coords = board.get_coords(UNCLICKED)
+        self.found_mines = board.count_total(FLAG, LIFE)
+        self.get_displayed_numbers(prev, changed)
         self.get_groups()
-        self.get_configs()
+        self.find_fixed_groups()
+        self.get_components()
+        self.get_weights(prev, cache)
         self.get_probs()
     def __str__(self):
         print_grid = []
         for row in self:
             print_grid.append(list(map(lambda p: round(100*p, 1), row)))
         return prettify_grid(print_grid, {0:' 0  ', 100:'100 '}, cell_size=4)
-    def get_displayed_numbers(self):
+    def get_displayed_numbers(self, prev=None, changed=()):
         """Put the displayed numbers in a dictionary with coordinate as key,
-        storing their neighbouring clickable cells."""
+        storing their neighbouring clickable cells and the number of mines
+        among them (taking off flags, and later any mines in groups found by
+        deduction - the number before deduction is kept as 'orig_nr'). If a
+        previous grid is given, only the cells next to the changed cells are
+        looked at."""
         self.numbers = dict()
-        edge_coords = set()
-        # Look through all the cells to find the revealed numbers
-        for (x, y) in self.all_coords:
-            contents = self.board[y][x]
-            if type(contents) is str or contents == 0:
+        nbr_table = get_nbr_table(self.x_size, self.y_size)
+        nbr_index_table = get_nbr_index_table(self.x_size, self.y_size)
+        codes = self.board.data
+        if prev is None:
+            check_coords = self.all_coords
+        else:
+            check_coords = set()
+            for (x, y) in changed:
+                check_coords.update(nbr_table[y*self.x_size + x])
+            for coord, nr_info in prev.numbers.items():
+                if coord not in check_coords:
+                    nr = nr_info['orig_nr']
+                    self.numbers[coord] = {'nr':nr, 'orig_nr':nr,
+                                           'nbrs':nr_info['nbrs'], 'groups':[]}
+        # Look through the cells to find the revealed numbers
+        for (x, y) in check_coords:
+            code = codes[y*self.x_size + x]
+            if code >> COUNT_BITS != NUMBER or code & COUNT_MASK == 0:
                 continue
-            nr = contents
-            nbrs = get_nbrs(x, y, self.x_size, self.y_size)
+            contents = nr = code & COUNT_MASK
+            nbrs = nbr_table[y*self.x_size + x]
             clickable_nbrs = []
-            for (i, j) in nbrs:
-                c = self.board[j][i]
-                if str(c)[0] in ['F', 'L']:
-                    nr -= int(c[1])
-                elif str(c)[0] in ['U', 'M']:
+            for (i, j), k in zip(nbrs, nbr_index_table[y*self.x_size + x]):
+                state = codes[k] >> COUNT_BITS
+                if state == FLAG or state == LIFE:
+                    nr -= codes[k] & COUNT_MASK
+                elif state == UNCLICKED or state == MINE:
                     # Include displayed mines for state before game was lost
                     clickable_nbrs.append((i, j))
-            edge_coords.update(clickable_nbrs)
             # Check number isn't too high for the available space
             if nr > len(clickable_nbrs) * self.max_per_cell:
                 msg = "Error: number {} in cell {} is too high"
                 raise ValueError(msg.format(contents, (x, y)))
             clickable_nbrs.sort() # To help with debugging
-            self.numbers[(x, y)] = {'nr':nr, 'nbrs':clickable_nbrs, 'groups':[]}
+            self.numbers[(x, y)] = {'nr':nr, 'orig_nr':nr,
+                                    'nbrs':clickable_nbrs, 'groups':[]}
         # All coords that are clickable and next to a number
-        self.edge_coords = sorted(list(edge_coords))
+        self.edge_coords = sorted({c for nr_info in self.numbers.values()
+                                   for c in nr_info['nbrs']})
     def get_groups(self):
         """Find the equivalence groups and store in a list."""
         self.groups = []
@@ -75,14 +123,13 @@ class ProbsGrid(list):
         for nr_coord, nr_info in self.numbers.items():
             for clickable in nr_info['nbrs']:
                 nr_nbrs_of_unclicked.setdefault(clickable, []).append(nr_coord)
-                nr_nbrs_of_unclicked[clickable].sort() # for comparison
-        # Convert lists to tuples which are hashable and loop once for each
-        #  equivalence group. Could be sped up..?
-        for nr_nbrs in set(map(tuple, nr_nbrs_of_unclicked.values())):
-            # Get all coords that share the same number neighbours and are
-            # therefore in an equivalence group
-            coords = [c for (c, nbrs) in nr_nbrs_of_unclicked.items()
-                if tuple(nbrs) == nr_nbrs]
+        # Collect the coords that share the same (sorted) number neighbours and
+        #  are therefore in an equivalence group
+        coords_by_nr_nbrs = dict()
+        for clickable, nr_nbrs in nr_nbrs_of_unclicked.items():
+            coords_by_nr_nbrs.setdefault(tuple(sorted(nr_nbrs)), []).append(
+                clickable)
+        for nr_nbrs, coords in coords_by_nr_nbrs.items():
             # Store the equivalence group referencing its coords and the shared
             # number coordinates (this is used to reference the dictionary
             # self.numbers which is created in method get_numbers)
@@ -98,58 +145,274 @@ class ProbsGrid(list):
         for i, g in enumerate(self.groups):
             for nr in g['nr_coords']:
                 self.numbers[nr]['groups'].append(i)
-    def get_configs(self):
-        ttotal = t1 = t2 = t3 = 0
-        ttotalstart = tm.time()
-        # Initialise the list of configurations for the number of mines in each
-        #  group, with the index within each configuration corresponding to the
-        #  group index in self.groups. Each list in cfgs will be filled in from
-        #  left to right
-        cfgs = [[0]*len(self.groups)]
-        # Loop through the groups/along the configurations
-        for i, g in enumerate(self.groups):
-            # Copy configs into temporary list to loop through, reset cfgs
-            subcfgs = cfgs[:] #configurations filled in up to index i
-            cfgs = []
-            # For each configuration branch off with new configurations
-            # after filling a number of mines for the next group.
-            for cfg in subcfgs:
-                g_min = 0
-                g_max = g['max'] # obtained by taking min of neighbouring nrs
-                t2start = tm.time()
-                # Loop through the numbers next to the current group to
-                # determine bounds on how many mines the group could contain
-                for coord in g['nr_coords']:
-                    nr = self.numbers[coord]
-                    # Group indices are stored in each nr dict
-                    # Get the index of the current group within the current nr
-                    grp_index = nr['groups'].index(i)
-                    prev_grps = nr['groups'][:grp_index]
-                    next_grps = nr['groups'][grp_index+1:]
-                    # The effective value of the number 'nr' after mines have
-                    # been placed as in the current cfg
-                    t1start = tm.time()
-                    nr_val = nr['nr']
-                    for j in prev_grps:
-                        nr_val -= cfg[j]
-                    g_max = min(g_max, nr_val)
-                    space = 0
-                    for j in next_grps:
-                        space += self.groups[j]['max']
-                    g_min = max(g_min, nr_val - space)
-                    t1 += tm.time() - t1start
-                t2 += tm.time() - t2start
-                t3start = tm.time()
-                for j in range(g_min, g_max + 1):
-                    new_cfg = cfg[:]
-                    new_cfg[i] = j
-                    cfgs.append(new_cfg)
-                t3 += tm.time() - t3start
-            # print len(g['coords']), cfgs
-        self.configs = sorted(map(tuple, cfgs))
-        ttotal += tm.time() - ttotalstart
-        print('{:.3f}, {:.3f}, {:.3f}. Total: {:.2f}'.format(t1, t2, t3,
-                                                             ttotal))
+    def find_fixed_groups(self):
+        """Find the groups whose number of mines follows from the numbers by
+        deduction (see deduction.py), storing it as g['fixed']. These groups
+        are left out of the enumeration, with their mines taken off the
+        numbers next to them."""
+        constraints = [(sum(1 << i for i in nr_info['groups']), nr_info['nr'])
+                       for nr_info in self.numbers.values()]
+        try:
+            fixed = deduce(constraints, [g['max'] for g in self.groups])
+        except ValueError:
+            raise ValueError("No valid configurations for the board")
+        for i, m in fixed.items():
+            g = self.groups[i]
+            g['fixed'] = m
+            for coord in g['nr_coords']:
+                self.numbers[coord]['nr'] -= m
+                self.numbers[coord]['groups'].remove(i)
+        # Update the upper bounds on the remaining groups
+        for g in self.groups:
+            if 'fixed' not in g:
+                min_nr = min(self.numbers[c]['nr'] for c in g['nr_coords'])
+                g['max'] = min(len(g['coords'])*self.max_per_cell, min_nr)
+    def get_components(self):
+        """Split the groups into connected components, where groups are
+        connected if they are next to a common number. Configurations of
+        separate components only interact through the total number of mines,
+        so each component is enumerated separately. The groups found by
+        deduction make up one more component, with a single configuration."""
+        self.components = []
+        comp_indices = [None] * len(self.groups)
+        fixed = [i for i, g in enumerate(self.groups) if 'fixed' in g]
+        for i in fixed:
+            comp_indices[i] = -1
+        for first in range(len(self.groups)):
+            if comp_indices[first] is not None:
+                continue
+            comp_indices[first] = len(self.components)
+            grps = []
+            check = [first]
+            while check:
+                i = check.pop()
+                grps.append(i)
+                for nr in self.groups[i]['nr_coords']:
+                    for j in self.numbers[nr]['groups']:
+                        if comp_indices[j] is None:
+                            comp_indices[j] = len(self.components)
+                            check.append(j)
+            self.components.append({'groups': sorted(grps)})
+        if fixed:
+            self.components.append({'groups': fixed, 'fixed': True})
+    def get_comp_signature(self, comp):
+        """Get a hashable description of a component, which determines its
+        weights - its groups in order, with the numbers next to them and the
+        values of the numbers."""
+        grps = [self.groups[i] for i in comp['groups']]
+        nr_coords = sorted({c for g in grps for c in g['nr_coords']})
+        return (tuple((tuple(sorted(g['coords'])), tuple(g['nr_coords']))
+                      for g in grps),
+                tuple(self.numbers[c]['nr'] for c in nr_coords))
+    def get_weights(self, prev=None, cache=None):
+        """Find the weights of each component (see get_comp_weights), reusing
+        the weights of any identical component in the previous grid, or of
+        any component with the same pattern in the cache."""
+        self.comp_weights = dict() #by component signature
+        for comp in self.components:
+            if comp.get('fixed'):
+                self.get_fixed_weights(comp)
+                continue
+            key = self.get_comp_signature(comp)
+            if prev is not None and key in prev.comp_weights:
+                comp['weights'], comp['group_weights'] = prev.comp_weights[key]
+            elif (cache is not None
+                  and len(comp['groups']) >= self.min_cached_groups):
+                self.get_cached_comp_weights(comp, cache)
+            else:
+                self.get_comp_weights(comp)
+            self.comp_weights[key] = comp['weights'], comp['group_weights']
+    def get_fixed_weights(self, comp):
+        """Set the weights of the component of groups found by deduction, which
+        has a single configuration (with weight 1, since the weights of a
+        component can be scaled freely)."""
+        cfg = [self.groups[i]['fixed'] for i in comp['groups']]
+        weights = [0] * sum(cfg) + [1]
+        comp['weights'] = weights
+        comp['group_weights'] = [[weights if j == m_i else [0] * len(weights)
+                                  for j in range(m_i + 1)] for m_i in cfg]
+    def get_cached_comp_weights(self, comp, cache):
+        """Get the weights of a component from the cache, or find them and add
+        them to the cache."""
+        numbers = {c: self.numbers[c]['nr'] for i in comp['groups']
+                   for c in self.groups[i]['nr_coords']}
+        pattern, order = get_canonical_pattern(
+            [self.groups[i]['coords'] for i in comp['groups']], numbers,
+            self.max_per_cell)
+        cached = cache.get(pattern)
+        if cached is None:
+            self.get_comp_weights(comp)
+            cache.add(pattern, (comp['weights'],
+                                [comp['group_weights'][p] for p in order]))
+        else:
+            # The group weights are stored in the pattern's order
+            weights, group_weights = cached
+            comp['weights'] = weights
+            comp['group_weights'] = [None] * len(order)
+            for g_weights, p in zip(group_weights, order):
+                comp['group_weights'][p] = g_weights
+    def get_search_order(self, grps):
+        """Order the groups of a component so that each group shares as many
+        numbers as possible with the groups before it. This means numbers are
+        completed early in the search, so dead branches are cut off early."""
+        order = []
+        touched = set() #numbers next to a group already in the order
+        # Number of touched numbers next to each remaining group
+        scores = {i: 0 for i in grps}
+        while scores:
+            best = max(scores, key=lambda i: (scores[i], -i))
+            del scores[best]
+            order.append(best)
+            for c in self.groups[best]['nr_coords']:
+                if c not in touched:
+                    touched.add(c)
+                    for i in self.numbers[c]['groups']:
+                        if i in scores:
+                            scores[i] += 1
+        return order
+    def iter_comp_configs(self, grps):
+        """Generate the configurations of a component, as tuples of the number
+        of mines in each of its groups, with a depth-first search. The number
+        of mines still needed by each number and the space left in its
+        unassigned groups are updated as groups are assigned, which bounds the
+        number of mines the next group can take."""
+        order = self.get_search_order(grps)
+        nr_coords = sorted({c for i in grps
+                            for c in self.groups[i]['nr_coords']})
+        nr_indices = {c: a for a, c in enumerate(nr_coords)}
+        # Mines still needed by each number
+        rem = [self.numbers[c]['nr'] for c in nr_coords]
+        # Maximum number of mines in the unassigned groups next to each number
+        space = [sum(self.groups[i]['max'] for i in self.numbers[c]['groups'])
+                 for c in nr_coords]
+        grp_nrs = [[nr_indices[c] for c in self.groups[i]['nr_coords']]
+                   for i in order]
+        grp_max = [self.groups[i]['max'] for i in order]
+        # Position of each of the component's groups in the search order
+        positions = [order.index(i) for i in grps]
+        n = len(order)
+        cfg = [0] * n
+        cfg_max = [0] * n
+        # The search is done with a loop rather than recursion, going down to
+        #  the next group (descend) or back up to change the previous one.
+        d = 0
+        descend = True
+        while d >= 0:
+            if descend:
+                if d == n:
+                    yield tuple([cfg[p] for p in positions])
+                    d -= 1
+                    descend = False
+                    continue
+                nrs, size = grp_nrs[d], grp_max[d]
+                lo, hi = 0, size
+                for a in nrs:
+                    space[a] -= size
+                    if rem[a] - space[a] > lo:
+                        lo = rem[a] - space[a]
+                    if rem[a] < hi:
+                        hi = rem[a]
+                if lo > hi: #dead branch
+                    for a in nrs:
+                        space[a] += size
+                    d -= 1
+                    descend = False
+                    continue
+                cfg[d], cfg_max[d] = lo, hi
+                for a in nrs:
+                    rem[a] -= lo
+                d += 1
+            elif cfg[d] < cfg_max[d]:
+                # Add a mine to the group and go back down
+                cfg[d] += 1
+                for a in grp_nrs[d]:
+                    rem[a] -= 1
+                d += 1
+                descend = True
+            else:
+                for a in grp_nrs[d]:
+                    rem[a] += cfg[d]
+                    space[a] += grp_max[d]
+                d -= 1
+    def get_comp_weights(self, comp):
+        """Sum the weights of the component's configurations by their total
+        number of mines m, storing the totals in comp['weights'][m] and the
+        totals for configurations with j mines in the component's group i in
+        comp['group_weights'][i][j][m]. The configurations are added as they
+        are generated, so they are never all held in memory."""
+        grps = comp['groups']
+        max_mines = sum(self.groups[i]['max'] for i in grps)
+        # The log of the factor of each group in the product term of the weight
+        #  of a configuration (see get_probs), by the number of mines in the
+        #  group. The weights are scaled by the largest possible product so
+        #  that they can't overflow, which cancels out when normalising.
+        log_factors = []
+        for i in grps:
+            size = len(self.groups[i]['coords'])
+            log_factors.append([log_combs(size, j, self.max_per_cell)
+                                - log_fac(j)
+                                for j in range(self.groups[i]['max'] + 1)])
+        log_scale = sum(max(f) for f in log_factors)
+        if np is not None:
+            weights, group_weights = self.sum_weights_array(
+                grps, log_factors, log_scale, max_mines)
+        else:
+            weights, group_weights = self.sum_weights(
+                grps, log_factors, log_scale, max_mines)
+        # Drop the totals beyond the most mines in any configuration
+        while len(weights) > 1 and weights[-1] == 0:
+            weights.pop()
+        comp['weights'] = weights
+        comp['group_weights'] = [[m_weights[:len(weights)]
+                                  for m_weights in g_weights]
+                                 for g_weights in group_weights]
+    def sum_weights(self, grps, log_factors, log_scale, max_mines):
+        """Sum the weights of the configurations of a component (see
+        get_comp_weights), returning the lists of totals."""
+        weights = [0] * (max_mines + 1)
+        group_weights = [[[0] * (max_mines + 1) for j in range(len(f))]
+                         for f in log_factors]
+        for cfg in self.iter_comp_configs(grps):
+            m = sum(cfg)
+            log_w = -log_scale
+            for f, m_i in zip(log_factors, cfg):
+                log_w += f[m_i]
+            w = exp(log_w)
+            weights[m] += w
+            for g_weights, m_i in zip(group_weights, cfg):
+                g_weights[m_i][m] += w
+        return weights, group_weights
+    def sum_weights_array(self, grps, log_factors, log_scale, max_mines):
+        """Array-backed equivalent of sum_weights, taking the configurations
+        in blocks as the rows of an integer matrix."""
+        nr_grps = len(grps)
+        width = max(len(f) for f in log_factors)
+        table = np.full((nr_grps, width), -np.inf)
+        for i, f in enumerate(log_factors):
+            table[i, :len(f)] = f
+        rows = np.arange(nr_grps)
+        # The group totals are flattened, indexed by (i*width + j)*M + m
+        M = max_mines + 1
+        offsets = rows * width * M
+        weights = np.zeros(M)
+        group_weights = np.zeros(nr_grps * width * M)
+        configs = self.iter_comp_configs(grps)
+        while True:
+            block = np.array(list(islice(configs, self.config_block_size)),
+                             dtype=np.intp)
+            if len(block) == 0:
+                break
+            m = block.sum(axis=1)
+            w = np.exp(table[rows, block].sum(axis=1) - log_scale)
+            weights += np.bincount(m, w, minlength=M)
+            indices = offsets + block * M + m[:, None]
+            group_weights += np.bincount(indices.ravel(),
+                                         np.repeat(w, nr_grps),
+                                         minlength=len(group_weights))
+        group_weights = group_weights.reshape(nr_grps, width, M)
+        return (weights.tolist(),
+                [group_weights[i, :len(f)].tolist()
+                 for i, f in enumerate(log_factors)])
     def get_probs(self):
         # Number of remaining clickable cells
         n = len(self.clickable_coords)
@@ -157,73 +420,138 @@ class ProbsGrid(list):
         k = self.nr_mines - self.found_mines
         # Number of cells which are next to a revealed number
         S = len(self.edge_coords)
-        # Probabilities associated with each configuration in self.configs
-        cfg_probs = []
-        for cfg in self.configs:
-            # print(cfg)
-            M = sum(cfg) #total mines in cfg
-            if M > k: #too many mines
-                cfg_probs.append(0)
-                continue
+        # A configuration with m_i mines in group i (of size g_i), M in total,
+        #  has weight proportional to the number of arrangements of the k
+        #  remaining mines:
+        #    k!/(k - M)! * prod(combs(g_i, m_i)/m_i!) * combs(n - S, k - M)
+        #  where the last term is for the outer cells. Only the product term
+        #  depends on the individual components, so their weights are found
+        #  separately and convolved, and the rest is a function of M.
+        log_outer = []
+        for M in range(k + 1):
             if k - M > self.max_per_cell * (n - S): #not enough outer space
-                cfg_probs.append(0)
-                continue
-            # Initiate the number of combinations
-            combs = fac(k) / fac(k - M)
-            # This is the product term in xi(cfg)
-            for i, m_i in enumerate(cfg):
-                g_size = len(self.groups[i]['coords'])
-                combs *= get_combs(g_size, m_i, self.max_per_cell)
-                combs /= fac(m_i)
-            cfg_probs.append(combs * get_combs(n - S, k - M, self.max_per_cell))
-            # print(n, k, S, M, combs)
-        # print(cfg_probs)
-        weight = log(sum(cfg_probs))
-        for i, p in enumerate(cfg_probs):
-            if p == 0: #...why? error?
-                print("Zero probability for cfg:")
-                print(self.configs[i])
-                continue
-            cfg_probs[i] = exp(log(p) - weight)
-        # print(self.configs)
-        # print(cfg_probs)
-        expected = 0
-        for i, g in enumerate(self.groups):
-            g_size = len(g['coords'])
-            probs = [] #index to correspond to the number of mines in the group
-            unsafe_prob = 0 #prob of a cell in the group having at least 1 mine
-            # Loop through the numbers of mines that can be held by the group
-            for j in range(g_size * self.max_per_cell + 1):
-                p = sum([cfg_probs[k] for k, c in enumerate(self.configs)
-                         if c[i]==j])
-                probs.append(p)
-                # print(p, get_unsafe_prob(g_size, j, self.per_cell))
-                unsafe_prob += p * get_unsafe_prob(g_size, j, self.max_per_cell)
-                if unsafe_prob > 1.0001:
-                    print("Invalid configuration.")
-                    print(self.configs)
-                    print(cfg_probs)
-                    print(probs)
-                    return
-            # Probability of the group containing 0, 1, 2,... mines, where the
-            #  number corresponds to the index
-            g['probs'] = tuple(probs)
-            g['exp'] = 0
-            for n, p in enumerate(g['probs']):
-                g['exp'] += n * p
-            expected += g['exp']
-            for (x, y) in g['coords']:
-                # Round to remove error and allow checking for round probs
-                self[y][x] = round(unsafe_prob, 5)
+                log_outer.append(None)
+            else:
+                log_outer.append(log_perms(k, M)
+                                 + log_combs(n - S, k - M, self.max_per_cell))
+        if all(w is None for w in log_outer):
+            raise ValueError("No valid configurations for the board")
+        max_log = max(w for w in log_outer if w is not None)
+        outer_weights = [0 if w is None else exp(w - max_log)
+                         for w in log_outer]
+        # Weights by the number of mines in all components before and after
+        #  each component, to combine with the weights of each component.
+        before = [[1]]
+        for comp in self.components:
+            before.append(convolve(before[-1], comp['weights']))
+        after = [[1]]
+        for comp in reversed(self.components):
+            after.append(convolve(after[-1], comp['weights']))
+        after.reverse()
+        total_weights = [w * outer_weights[M] if M <= k else 0
+                         for M, w in enumerate(before[-1])]
+        norm = sum(total_weights)
+        if norm == 0:
+            raise ValueError("No valid configurations for the board")
+        for c, comp in enumerate(self.components):
+            others = convolve(before[c], after[c+1])
+            # Weight of the rest of the board for each number of mines in
+            #  this component
+            rest = [sum(w * outer_weights[m + M] for M, w in enumerate(others)
+                        if m + M <= k) / norm
+                    for m in range(len(comp['weights']))]
+            for i, g_weights in zip(comp['groups'], comp['group_weights']):
+                g = self.groups[i]
+                g_size = len(g['coords'])
+                # Probability of the group containing 0, 1, 2,... mines, where
+                #  the number corresponds to the index
+                g['probs'] = tuple(sum(w * r for w, r in zip(m_weights, rest))
+                                   for m_weights in g_weights)
+                g['exp'] = 0
+                unsafe_prob = 0 #prob of a cell in the group having a mine
+                for j, p in enumerate(g['probs']):
+                    g['exp'] += j * p
+                    if p > 0:
+                        unsafe_prob += p * get_unsafe_prob(g_size, j,
+                                                           self.max_per_cell)
+                for (x, y) in g['coords']:
+                    # Round to remove error and allow checking for round probs
+                    self[y][x] = round(unsafe_prob, 5)
         rem_coords = set(self.clickable_coords) - set(self.edge_coords)
+        self.outer_coords = sorted(rem_coords)
+        # The possible numbers of mines in the outer cells
+        self.outer_mines = [k - M for M, w in enumerate(total_weights)
+                            if w > 0]
         if len(rem_coords) > 0:
-            outer_mines = self.nr_mines - int(expected)
-            outer_prob = get_unsafe_prob(len(rem_coords), outer_mines,
-                                         self.max_per_cell)
+            # Average over the number of mines left for the outer cells
+            outer_prob = sum(w / norm * get_unsafe_prob(n - S, k - M,
+                                                        self.max_per_cell)
+                             for M, w in enumerate(total_weights) if w > 0)
         for (x, y) in rem_coords:
             self[y][x] = outer_prob
         # self.print_info()
+    def get_certain_cells(self):
+        """Get the list of cells which are certainly safe, and a dictionary of
+        the number of mines in the cells whose number of mines is certain
+        (those that are certainly full)."""
+        safe, mines = [], dict()
+        # Each group and the outer cells, with their possible numbers of mines
+        regions = [(g['coords'], [j for j, p in enumerate(g['probs']) if p])
+                   for g in self.groups]
+        regions.append((self.outer_coords, self.outer_mines))
+        for coords, nr_mines in regions:
+            if not coords:
+                continue
+            if nr_mines == [0]:
+                safe.extend(coords)
+            elif nr_mines == [len(coords) * self.max_per_cell]:
+                mines.update({c: self.max_per_cell for c in coords})
+        return sorted(safe), mines
+
+
+class GameSolver:
+    """Keep the probabilities for the current game of an engine, solving again
+    only the parts of the board changed by each action."""
+    def __init__(self, engine, ignore_flags=False):
+        self.engine = engine
+        self.ignore_flags = ignore_flags
+        self.engine.add_callback('new_game', self.reset)
+        self.engine.add_callback('update', self.cells_changed)
+        self.reset()
+    def reset(self):
+        self.probs = None
+        self.changed = set()
+    def cells_changed(self, cells):
+        self.changed.update(cells)
+    def get_probs(self):
+        """Get the ProbsGrid for the current board."""
+        # The engine's settings may have changed for the next game, so use the
+        #  settings the current game is being played with.
+        game = self.engine.game
+        settings = {'nr_mines': game.nr_mines, 'max_per_cell': game.per_cell}
+        if self.probs is not None and any(getattr(self.probs, s) != v
+                                          for s, v in settings.items()):
+            # The game started with different settings - solve from scratch
+            self.probs = None
+        if self.probs is None or self.changed:
+            self.probs = ProbsGrid(self.engine.get_board(), self.ignore_flags,
+                                   self.probs, self.changed, **settings)
+            self.changed = set()
+        return self.probs
+    def close(self):
+        """Stop following the engine's games."""
+        self.engine.remove_callback('new_game', self.reset)
+        self.engine.remove_callback('update', self.cells_changed)
+
 
+def convolve(a, b):
+    """Convolve two lists of weights indexed by number of mines."""
+    ret = [0] * (len(a) + len(b) - 1)
+    for i, x in enumerate(a):
+        if x:
+            for j, y in enumerate(b):
+                ret[i + j] += x * y
+    return ret
 
 
 
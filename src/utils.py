@@ -1,6 +1,9 @@
 
 import sys
-from os.path import join, dirname, abspath
+import json
+from os.path import join, dirname, abspath, exists
+from functools import lru_cache
+from importlib.util import find_spec
 
 
 __version__ = '2.1.1'
@@ -12,6 +15,9 @@ else:
     base_direc = dirname(src_direc)
 img_direc = join(base_direc, 'images')
 file_direc = join(base_direc, 'files')
+# Whether numpy is available. It's slow to import, so modules only needing it
+#  for larger boards import it when it's first used.
+has_numpy = find_spec('numpy') is not None
 
 diff_values = {
     'b': ( 8,  8,  10),
@@ -56,13 +62,41 @@ def prettify_grid(grid, repr_map=dict(), cell_size=1):
     ret = ret[:-1] # Remove trailing newline
     return ret
 
+@lru_cache(maxsize=16)
+def get_nbr_table(x_size, y_size):
+    """Get a table of the neighbours of every cell on a board of the given size
+    (including the cell itself), as tuples of coordinates indexed by the flat
+    cell index y*x_size + x. Tables are cached for the most recent sizes, so
+    they should not be modified."""
+    table = []
+    for y in range(y_size):
+        for x in range(x_size):
+            table.append(tuple((i, j)
+                               for i in range(max(0, x-1), min(x_size, x+2))
+                               for j in range(max(0, y-1), min(y_size, y+2))))
+    return tuple(table)
+
+@lru_cache(maxsize=16)
+def get_nbr_index_table(x_size, y_size):
+    """Equivalent to get_nbr_table, with the neighbours given as flat cell
+    indices rather than as coordinates."""
+    return tuple(tuple(j*x_size + i for (i, j) in nbrs)
+                 for nbrs in get_nbr_table(x_size, y_size))
+
 def get_nbrs(x, y, x_size, y_size):
-    nbrs = []
-    for i in range(max(0,x-1), min(x_size,x+2)):
-        for j in range(max(0,y-1), min(y_size,y+2)):
-            nbrs.append((i, j))
-    return nbrs
+    return get_nbr_table(x_size, y_size)[y*x_size + x]
 
 def calc_3bvps(h):
     # Round up to 2 d.p. (converting time to seconds)
     return (1e5 * h['3bv'] // h['time']) / 100 + 0.01
+
+def load_json_cache(path):
+    """Return the contents of the JSON cache file at the given path, or None if
+    it doesn't exist or is corrupt (so the values are recalculated)."""
+    if not exists(path):
+        return None
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except ValueError:
+        return None